@@ -0,0 +1,181 @@
+import math
+import re
+
+import numpy as np
+
+from instances.parser import Instancer
+
+# Fleets for every 100 customers, scaled with the size of the instance
+GENERATED_HOMO_VEHICLES = {
+    "C": [{"count": 25, "capacity": 200, "rate": 1.0}],
+    "R": [{"count": 25, "capacity": 200, "rate": 1.0}],
+    "RC": [{"count": 25, "capacity": 200, "rate": 1.0}],
+}
+
+GENERATED_HETERO_VEHICLES = {
+    "C": [
+        {"count": 20, "capacity": 100, "type": "A", "rate": 1.0},
+        {"count": 5, "capacity": 200, "type": "B", "rate": 1.2},
+    ],
+    "R": [
+        {"count": 10, "capacity": 50, "type": "A", "rate": 1.0},
+        {"count": 15, "capacity": 80, "type": "B", "rate": 1.2},
+        {"count": 10, "capacity": 120, "type": "C", "rate": 1.4},
+    ],
+    "RC": [
+        {"count": 10, "capacity": 40, "type": "A", "rate": 1.0},
+        {"count": 20, "capacity": 80, "type": "B", "rate": 1.2},
+        {"count": 10, "capacity": 150, "type": "C", "rate": 1.4},
+    ],
+}
+
+# Layout, customer count and optional seed, e.g. GC1000, GRC5000-7
+GENERATED_NAME = re.compile(r"G(RC|C|R)(\d+)(?:-(\d+))?")
+# Larger instances compute their distances when needed instead of storing them
+DENSE_LIMIT = 2000
+
+
+def is_generated(instance_type):
+    return GENERATED_NAME.fullmatch(instance_type.upper()) is not None
+
+
+def generate_positions(layout, size, side, rng):
+    """
+    Customer coordinates on a `side` x `side` square. Clustered customers
+    gather around `size / 10` centers, `RC` mixes both halves.
+    """
+    if layout == "R":
+        return rng.uniform(0, side, size=(size, 2))
+    if layout == "RC":
+        positions = np.concatenate(
+            [
+                generate_positions("C", size // 2, side, rng),
+                generate_positions("R", size - size // 2, side, rng),
+            ]
+        )
+        return positions[rng.permutation(size)]
+    centers = rng.uniform(0.1 * side, 0.9 * side, size=(max(1, size // 10), 2))
+    positions = centers[rng.integers(len(centers), size=size)]
+    positions = positions + rng.normal(0, 0.02 * side, size=(size, 2))
+    return positions.clip(0, side)
+
+
+def generate_stores(layout, size, seed=0):
+    """
+    Seeded Solomon like instance with `size` customers plus the depot, which
+    goes last and sits at the center. Clustered layouts have long services and
+    a long horizon like C1, the others short services like R1.
+    """
+    rng = np.random.default_rng(seed)
+    # The square grows with `size`, so the density matches the Solomon
+    # instances (100 customers on 100 x 100)
+    side = 100 * math.sqrt(size / 100)
+    positions = generate_positions(layout, size, side, rng)
+    depot = np.array([side / 2, side / 2])
+
+    service_time = 90.0 if layout == "C" else 10.0
+    horizon = (12 if layout == "C" else 4) * side
+    travel = np.sqrt(((positions - depot) ** 2).sum(axis=-1))
+    latest = np.maximum(horizon - travel - service_time, travel)
+    centers = rng.uniform(travel, latest)
+    widths = rng.uniform(0.05, 0.2, size=size) * horizon
+    ready_times = np.maximum(0, centers - widths / 2).round()
+    due_dates = np.minimum(horizon, centers + widths / 2).round()
+    if layout == "C":
+        demands = rng.integers(1, 5, size=size) * 10
+    else:
+        demands = rng.integers(1, 41, size=size)
+
+    stores = [
+        {
+            "position": (x, y),
+            "demand": float(demand),
+            "window": (ready_time, due_date),
+            "service_time": service_time,
+        }
+        for (x, y), demand, ready_time, due_date in zip(
+            positions.round(2).tolist(),
+            demands.tolist(),
+            ready_times.tolist(),
+            due_dates.tolist(),
+        )
+    ]
+    stores.append(
+        {
+            "position": tuple(depot.tolist()),
+            "demand": 0.0,
+            "window": (0.0, float(round(horizon))),
+            "service_time": 0.0,
+        }
+    )
+    return stores
+
+
+class PointDistances:
+    """
+    Euclidean distances between `positions`, computed when indexed instead of
+    kept as a matrix. `distances[i][j]` and `distances[rows, cols]` work as with
+    the dense matrix, with the same arithmetic, so the results match.
+    """
+
+    def __init__(self, positions):
+        self.x, self.y = positions[:, 0].copy(), positions[:, 1].copy()
+        self.xs, self.ys = self.x.tolist(), self.y.tolist()
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, cols = key
+            dx = self.x[cols] - self.x[rows]
+            dy = self.y[cols] - self.y[rows]
+            return np.sqrt(dx * dx + dy * dy)
+        return DistanceRow(self.xs[key], self.ys[key], self.xs, self.ys)
+
+    def tolist(self):
+        # Already as cheap to index as the plain list mirrors
+        return self
+
+
+class DistanceRow:
+    __slots__ = ("x", "y", "xs", "ys")
+
+    def __init__(self, x, y, xs, ys):
+        self.x, self.y, self.xs, self.ys = x, y, xs, ys
+
+    def __getitem__(self, idx):
+        dx = self.xs[idx] - self.x
+        dy = self.ys[idx] - self.y
+        return math.sqrt(dx * dx + dy * dy)
+
+
+class GeneratedInstancer(Instancer):
+    """
+    `Instancer` for a synthetic instance named `G<layout><size>[-<seed>]`, with
+    `C`, `R` or `RC` layouts like the Solomon families.
+    """
+
+    def __init__(self, instance_type, heterogeneous_vehicles=False):
+        instance_type = instance_type.upper()
+        match = GENERATED_NAME.fullmatch(instance_type)
+        if match is None:
+            raise ValueError(f"`{instance_type}` is not a generated instance name.")
+        layout, size, seed = match.group(1), int(match.group(2)), match.group(3)
+        self.config = "H" + instance_type if heterogeneous_vehicles else instance_type
+        self.stores = generate_stores(layout, size, int(seed or 0))
+        fleets = (
+            GENERATED_HETERO_VEHICLES
+            if heterogeneous_vehicles
+            else GENERATED_HOMO_VEHICLES
+        )
+        self.vehicles = [
+            dict(vehicle, count=math.ceil(vehicle["count"] * size / 100))
+            for vehicle in fleets[layout]
+        ]
+        self.build_arrays()
+
+    def build_distances(self, positions):
+        if len(positions) <= DENSE_LIMIT:
+            return super().build_distances(positions)
+        return PointDistances(positions)
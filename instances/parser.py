@@ -1,3 +1,6 @@
+import hashlib
+import os
+from functools import lru_cache
 from pathlib import Path
 from random import shuffle
 
@@ -40,7 +43,70 @@ HETERO_VEHICLES = {
         {"count": 5, "capacity": 200, "type": "B", "rate": 1.2},
     ],
 }
-PARSE_MAPPING = {1: "position", 3: "demand", 4: "window", 6: "service_time"}
+RECORD_DTYPE = np.dtype(
+    [
+        ("instance", "U8"),
+        ("x", "f8"),
+        ("y", "f8"),
+        ("demand", "f8"),
+        ("ready_time", "f8"),
+        ("due_date", "f8"),
+        ("service_time", "f8"),
+    ]
+)
+# Overrides where the parsed instance files are cached
+CACHE_ENV = "MTSP_CACHE_DIR"
+
+
+def parse_records(path):
+    # Every store of every instance in a Solomon file, in file order
+    records = []
+    instance_type = None
+    with open(path) as file:
+        for line in file:
+            values = line.split()
+            if len(values) == 1 and values[0].startswith(path.stem):
+                instance_type = values[0]
+            elif len(values) == 7 and instance_type:
+                try:
+                    records.append((instance_type, *map(float, values[1:])))
+                except ValueError:
+                    pass
+    return np.array(records, dtype=RECORD_DTYPE)
+
+
+def cache_folder():
+    # `$MTSP_CACHE_DIR`, else `mtsp` in the user cache folder, never the package
+    if os.environ.get(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV])
+    user_cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(user_cache) / "mtsp"
+
+
+@lru_cache(maxsize=None)
+def load_records(family):
+    """
+    Stores of the `family` Solomon file as a memory-mapped structured array.
+    The parsed file is cached in `cache_folder()`, keyed by its hash, so it is
+    only parsed once and every process maps the same pages.
+    """
+    path = Path(__file__).absolute().parent / f"{family}.txt"
+    digest = hashlib.sha1(path.read_bytes()).hexdigest()[:16]
+    folder = cache_folder()
+    cache_path = folder / f"{family}_{digest}.npy"
+    if not cache_path.exists():
+        records = parse_records(path)
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            # Renamed once complete, concurrent runs never read half a file
+            tmp_path = folder / f"{family}_{digest}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f_cache:
+                np.save(f_cache, records)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # Without a writable cache folder every run parses the file
+            return records
+    return np.load(cache_path, mmap_mode="r")
 
 
 class Instancer:
@@ -53,38 +119,35 @@ class Instancer:
         self.stores.append(warehouse)
         vehicles_types = HETERO_VEHICLES if heterogeneous_vehicles else HOMO_VEHICLES
         self.vehicles = vehicles_types[instance_type[:-2]]
+        self.build_arrays()
 
     def load_stores(self, instance_type):
-        with open(
-            Path(__file__).absolute().parent / f"{instance_type[:-2]}.txt",
-            "r",
-        ) as file:
-            lines = file.readlines()
-
-        stores = []
-        for idx, line1 in enumerate(lines):
-            if instance_type in line1:
-                for line2 in lines[idx + 1 :]:
-                    if instance_type[:-2] in line2:
-                        break
-                    line_split = line2.split()
-                    try:
-                        line_split = [float(value) for value in line_split]
-                        store = {}
-                        for idx, value in enumerate(line_split):
-                            key = PARSE_MAPPING.get(idx)
-                            if key:
-                                store[key] = (
-                                    (value, line_split[idx + 1])
-                                    if idx in [1, 4]
-                                    else value
-                                )
-                        stores.append(store) if store else None
-                    except:
-                        pass
-                break
-
-        return stores
+        records = load_records(instance_type[:-2])
+        records = records[records["instance"] == instance_type]
+        return [
+            {
+                "position": (x, y),
+                "demand": demand,
+                "window": (ready_time, due_date),
+                "service_time": service_time,
+            }
+            for _, x, y, demand, ready_time, due_date, service_time in (
+                records.tolist()
+            )
+        ]
+
+    def build_arrays(self):
+        self.distances = self.build_distances(self.get_store_positions())
+        windows = np.array([store["window"] for store in self.stores])
+        self.ready_times, self.due_dates = windows[:, 0], windows[:, 1]
+        self.service_times = np.array([store["service_time"] for store in self.stores])
+        self.demands = np.array([store["demand"] for store in self.stores])
+
+    def build_distances(self, positions):
+        # Dense depot-inclusive matrices so evaluation only does indexed lookups.
+        # The warehouse is the last store, so it is also the last row/column.
+        deltas = positions[np.newaxis, :, :] - positions[:, np.newaxis, :]
+        return np.sqrt((deltas**2).sum(axis=-1))
 
     def types2list(self):
         vehicles = []
@@ -97,10 +160,53 @@ class Instancer:
             )
         return vehicles
 
-    def get_instance_dict(self):
-        route_idx = self.types2list()
-        shuffle(route_idx)
-        return {"stores": self.stores, "vehicles": route_idx}
+    def get_instance_dict(self, vehicles=None):
+        # A given vehicle order (e.g. from a checkpoint) is kept as is
+        if vehicles is None:
+            route_idx = self.types2list()
+            shuffle(route_idx)
+        else:
+            route_idx = vehicles
+        instance = {
+            "stores": self.stores,
+            "vehicles": route_idx,
+            "distances": self.distances,
+            "ready_times": self.ready_times,
+            "due_dates": self.due_dates,
+            "service_times": self.service_times,
+            "demands": self.demands,
+            "positions": self.get_store_positions(),
+            "capacities": np.array([vehicle["capacity"] for vehicle in route_idx]),
+            "rates": np.array([vehicle["rate"] for vehicle in route_idx]),
+        }
+        instance["lookup"] = build_lookup(instance)
+        return instance
 
     def get_store_positions(self):
         return np.array([np.array(store["position"]) for store in self.stores])
+
+
+def build_lookup(instance):
+    # Plain list mirrors for the per-store Python loops, where indexing a list
+    # is much cheaper than indexing a numpy array element by element.
+    return {
+        key: instance[key].tolist()
+        for key in (
+            "distances",
+            "ready_times",
+            "due_dates",
+            "service_times",
+            "demands",
+            "capacities",
+            "rates",
+        )
+    }
+
+
+def get_instancer(instance_type, heterogeneous_vehicles=False):
+    # Solomon instances are read from the bundled files, the rest are generated
+    from instances.generator import GeneratedInstancer, is_generated
+
+    if is_generated(instance_type):
+        return GeneratedInstancer(instance_type, heterogeneous_vehicles)
+    return Instancer(instance_type, heterogeneous_vehicles)
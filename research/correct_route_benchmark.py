@@ -0,0 +1,62 @@
+# %%
+import random
+import timeit
+
+import pandas as pd
+
+from instances.parser import Instancer
+from scripts.utils import (
+    correct_route,
+    correct_route_two_pass,
+    init_iterate_and_distribute,
+)
+
+# %%
+INSTANCES = ["C101", "C201", "R101", "R201", "RC101", "RC201"]
+SAMPLES = 500
+REPEAT = 5
+
+random.seed(0)
+
+# %%
+rows = []
+for instance_type in INSTANCES:
+    for heterogeneous in (False, True):
+        instance = Instancer(instance_type, heterogeneous_vehicles=heterogeneous)
+        instance_dict = instance.get_instance_dict()
+        store_count = len(instance_dict["stores"]) - 1
+        individuals = [
+            init_iterate_and_distribute(list, instance_dict, part2_type="choice")
+            for _ in range(SAMPLES)
+        ]
+        # Unrepaired genomes, like the ones coming out of crossover and mutation
+        for ind in individuals:
+            ind[:store_count] = random.sample(ind[:store_count], store_count)
+        assert all(
+            correct_route(store_count, instance_dict, ind)
+            == correct_route_two_pass(store_count, instance_dict, ind)
+            for ind in individuals
+        )
+
+        row = {"instance": instance.config}
+        for name, func in (
+            ("two_pass", correct_route_two_pass),
+            ("prefix_sum", correct_route),
+        ):
+            elapsed = min(
+                timeit.repeat(
+                    lambda: [
+                        func(store_count, instance_dict, ind) for ind in individuals
+                    ],
+                    number=1,
+                    repeat=REPEAT,
+                )
+            )
+            row[f"{name}_us"] = elapsed / SAMPLES * 1e6
+        row["speedup"] = row["two_pass_us"] / row["prefix_sum_us"]
+        rows.append(row)
+
+results = pd.DataFrame(rows).set_index("instance")
+print(results.round(2))
+
+# %%
@@ -62,8 +62,10 @@ filename = "HC201_09_30_190346"
 exp = pd.read_csv(
     f"../results/{filename}/results/fitness.csv",
     sep=",",
-    converters={"ind": literal_eval},
+    converters={"ind": lambda ind: literal_eval(ind) if ind else None},
 )
+# The fittest genome is only logged when it changes
+exp["ind"] = exp["ind"].ffill()
 import math
 
 # %%
@@ -0,0 +1,415 @@
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import click
+import numpy as np
+
+from instances.parser import get_instancer
+from scripts.instrumentation import time_operators
+from scripts.main import create_toolbox, evaluate_invalid
+from scripts.utils import (
+    correct_genomes,
+    correct_route,
+    eval_routes,
+    find_max_index,
+    find_min_index,
+)
+
+# Modules every run and pool worker imports, and what they must not pull in
+CORE_MODULES = ["scripts.main", "scripts.utils", "scripts.parallel"]
+HEAVY_MODULES = ["matplotlib", "tqdm", "pandas", "numba"]
+INSTANCES = ["C101", "C201", "R101", "R201", "RC101", "RC201"]
+# Generated instances, see `instances.generator`
+SCALING_INSTANCES = ["GC1000", "GR1000", "GRC1000", "GRC5000"]
+OPERATORS = [
+    "select",
+    "clone",
+    "mate_1",
+    "mutate_swap",
+    "mutate_inc",
+    "mutate_dec",
+    "correct_population",
+    "evaluate_population",
+    "correct_genomes",
+    "evaluate_genomes",
+    "local_search",
+]
+
+
+def list_instances():
+    # Every instance name found in the bundled Solomon files
+    names = []
+    for path in sorted(Path(__file__).absolute().parent.parent.glob("instances/*.txt")):
+        with open(path) as file:
+            names.extend(
+                line.strip()
+                for line in file
+                if line.strip().startswith(path.stem) and len(line.split()) == 1
+            )
+    return names
+
+
+def run_case(instance_type, heterogeneous, options):
+    random.seed(options["seed"])
+    np.random.seed(options["seed"])
+    toolbox, instance = create_toolbox(
+        instance_type,
+        heterogeneous_vehicles=heterogeneous,
+        part2_type=options["part2_type"],
+        evaluator=options["evaluator"],
+        genome=options["genome"],
+        decoder=options["decoder"],
+        fitness_cache=options["fitness_cache"],
+        route_cache=options["route_cache"],
+        selection=options["selection"],
+        local_search=options["local_search"],
+        local_search_rate=options["local_search_rate"],
+        neighbours=options["neighbours"],
+        backend=options["backend"],
+        engine=options["engine"],
+        screen_margin=options["screen_margin"],
+    )
+    timings = time_operators(toolbox, OPERATORS)
+    evaluations = 0
+
+    def count_evaluations(evaluate):
+        def counted(individuals):
+            nonlocal evaluations
+            evaluations += len(individuals)
+            return evaluate(individuals)
+
+        return counted
+
+    # The `matrix` engine evaluates whole genome matrices instead
+    for name in ("evaluate_population", "evaluate_genomes"):
+        toolbox.register(name, count_evaluations(getattr(toolbox, name)))
+
+    start = time.perf_counter()
+    pop = toolbox.population(n=options["pop_size"])
+    evaluate_invalid(toolbox, pop)
+    all_time_fittest = min(pop, key=lambda ind: ind.fitness.values[0])
+    for _ in range(options["rounds"]):
+        pop = toolbox.next_generation(
+            pop,
+            all_time_fittest,
+            options["pop_size"],
+            options["cxpb1"],
+            options["mutpb1"],
+            options["mutpb2"],
+            False,
+        )
+        fraser = min(pop, key=lambda ind: ind.fitness.values[0])
+        if fraser.fitness.values[0] < all_time_fittest.fitness.values[0]:
+            all_time_fittest = fraser
+    elapsed = time.perf_counter() - start
+    toolbox.shutdown()
+
+    return {
+        "instance": instance.config,
+        "elapsed": elapsed,
+        "generations_per_sec": options["rounds"] / elapsed,
+        "evaluations": evaluations,
+        "evaluations_per_sec": evaluations / elapsed,
+        "operators": dict(timings),
+        # Kilobytes on Linux, every case runs in a fresh process
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "best_cost": all_time_fittest.fitness.values[0],
+        "cache_report": toolbox.cache_report(),
+    }
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--ins", "instances", multiple=True)
+@click.option("--all-instances", is_flag=True)
+@click.option("--scaling", is_flag=True)
+@click.option("--rounds", default=200, type=int)
+@click.option("--pop-size", default=100, type=int)
+@click.option("--seed", default=0, type=int)
+@click.option("--cxpb1", default=0.6, type=float)
+@click.option("--mutpb1", default=0.2, type=float)
+@click.option("--mutpb2", default=0.2, type=float)
+@click.option(
+    "--part2-type",
+    default="choice",
+    type=click.Choice(["uniform", "choice", "greedy"]),
+)
+@click.option(
+    "--evaluator",
+    default="matrix",
+    type=click.Choice(["matrix", "scalar", "batch", "delta"]),
+)
+@click.option(
+    "--genome",
+    default="list",
+    type=click.Choice(["list", "array"]),
+)
+@click.option(
+    "--decoder",
+    default="repair",
+    type=click.Choice(["repair", "split"]),
+)
+@click.option(
+    "--selection",
+    default="tournament",
+    type=click.Choice(["tournament", "deap-tournament", "roulette", "sus"]),
+)
+@click.option(
+    "--local-search",
+    default="off",
+    type=click.Choice(["off", "elite", "offspring"]),
+)
+@click.option("--local-search-rate", default=0.1, type=float)
+@click.option("--neighbours", default=10, type=int)
+@click.option(
+    "--backend",
+    default="python",
+    type=click.Choice(["python", "numba"]),
+)
+@click.option(
+    "--engine",
+    default="deap",
+    type=click.Choice(["deap", "matrix"]),
+)
+@click.option("--screen-margin", default=None, type=float)
+@click.option("--fitness-cache", default=0, type=int)
+@click.option("--route-cache", default=0, type=int)
+@click.option("--output", default="bench.json", type=click.Path())
+def run(instances, all_instances, scaling, output, **options):
+    """Runs the fixed-seed benchmark and writes its results as JSON."""
+    if all_instances:
+        instances = list_instances()
+    if scaling:
+        instances = [*instances, *SCALING_INSTANCES]
+    instances = instances or INSTANCES
+
+    results = []
+    for instance_type in instances:
+        for heterogeneous in (False, True):
+            # A fresh process per case, so peak RSS and `deap.creator` are its own
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(
+                    run_case, instance_type, heterogeneous, options
+                ).result()
+            results.append(result)
+            click.echo(
+                f"{result['instance']:>7} "
+                f"{result['generations_per_sec']:8.2f} gen/s "
+                f"{result['evaluations_per_sec']:10.1f} eval/s "
+                f"{result['peak_rss_kb'] / 1024:7.1f} MB "
+                f"best={result['best_cost']:.2f}"
+            )
+
+    with open(output, "w+") as f_output:
+        json.dump(
+            {
+                "created": datetime.now().isoformat(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "options": options,
+                "results": results,
+            },
+            f_output,
+            indent=2,
+        )
+
+
+@cli.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("candidate", type=click.Path(exists=True))
+@click.option("--threshold", default=0.1, type=float)
+def compare(baseline, candidate, threshold):
+    """
+    Compares generations/sec of two benchmark runs. Exits with an error when
+    any instance got slower by more than `threshold` (a fraction).
+    """
+    with open(baseline) as f_baseline, open(candidate) as f_candidate:
+        before = {res["instance"]: res for res in json.load(f_baseline)["results"]}
+        after = {res["instance"]: res for res in json.load(f_candidate)["results"]}
+
+    slowdowns = []
+    for name in sorted(before.keys() & after.keys()):
+        ratio = after[name]["generations_per_sec"] / before[name]["generations_per_sec"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "SLOWER"
+            slowdowns.append(name)
+        click.echo(
+            f"{name:>7} {before[name]['generations_per_sec']:8.2f} -> "
+            f"{after[name]['generations_per_sec']:8.2f} gen/s "
+            f"({ratio - 1:+.1%}) {flag}"
+        )
+    if slowdowns:
+        raise click.ClickException(
+            f"{len(slowdowns)} instances slower than {threshold:.0%}: "
+            + ", ".join(sorted(slowdowns))
+        )
+
+
+def import_times(module):
+    """
+    Cumulative import time of `module` in microseconds, measured with
+    `python -X importtime` in a fresh interpreter, and every module it imports.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).absolute().parent.parent,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times[module], set(times)
+
+
+@cli.command()
+@click.option("--module", "modules", multiple=True)
+@click.option("--budget", default=500, type=float, help="Milliseconds.")
+@click.option("--repeat", default=3, type=int)
+def importtime(modules, budget, repeat):
+    """
+    Checks that the core GA modules import within `budget` milliseconds and
+    without plotting, progress bar or dataframe dependencies.
+    """
+    failures = []
+    for module in modules or CORE_MODULES:
+        runs = [import_times(module) for _ in range(repeat)]
+        elapsed = min(cumulative for cumulative, _ in runs) / 1000
+        heavy = sorted(
+            name for name in HEAVY_MODULES if any(name in names for _, names in runs)
+        )
+        flag = ""
+        if elapsed > budget or heavy:
+            flag = "SLOW" if not heavy else "imports " + ", ".join(heavy)
+            failures.append(module)
+        click.echo(f"{module:>20} {elapsed:8.1f} ms {flag}")
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} modules over {budget:.0f}ms or importing "
+            + ", ".join(HEAVY_MODULES)
+            + ": "
+            + ", ".join(failures)
+        )
+
+
+def parity_case(instance_dict, genomes):
+    """
+    Genomes where the `numba` kernels and their pure-Python counterparts
+    disagree, for evaluation, repair and the capacity limits of each route.
+    The repairs of whole matrices, as the `matrix` engine does them, must match
+    too.
+    """
+    from scripts.kernels import (
+        correct_genomes_compiled,
+        correct_route_compiled,
+        eval_genomes_compiled,
+        eval_routes_compiled,
+        instance_arrays,
+        max_index,
+        min_index,
+    )
+
+    arrays = instance_arrays(instance_dict)
+    demands, capacities = arrays[4], arrays[5]
+    store_count = len(instance_dict["stores"]) - 1
+    matrix = np.array(genomes, dtype=np.int32)
+    batch_repairs = correct_genomes(store_count, instance_dict, matrix.copy())
+    batch_compiled = correct_genomes_compiled(store_count, None, matrix.copy(), arrays)
+    batch_costs = eval_genomes_compiled(matrix, arrays=arrays)
+    mismatches = []
+    for genome, batch_repair, compiled_repair, batch_cost in zip(
+        genomes, batch_repairs.tolist(), batch_compiled.tolist(), batch_costs.tolist()
+    ):
+        repaired = correct_route(store_count, instance_dict, genome)
+        checks = [
+            (
+                eval_routes(genome, instance_dict),
+                eval_routes_compiled(genome, arrays=arrays),
+            ),
+            (eval_routes(genome, instance_dict), (batch_cost,)),
+            (repaired, correct_route_compiled(store_count, None, genome, arrays)),
+            (repaired, batch_repair),
+            (repaired, compiled_repair),
+            (
+                eval_routes(repaired, instance_dict),
+                eval_routes_compiled(repaired, arrays=arrays),
+            ),
+        ]
+        route_starts = [0, *genome[store_count:]]
+        route_finishes = [*genome[store_count:], store_count]
+        for v_idx, (start, finish) in enumerate(zip(route_starts, route_finishes)):
+            route = genome[start:finish]
+            route_array = np.array(route, dtype=np.int64)
+            checks.append(
+                (
+                    find_min_index(route, v_idx, instance_dict),
+                    min_index(route_array, capacities[v_idx], demands),
+                )
+            )
+            checks.append(
+                (
+                    find_max_index(route, v_idx, instance_dict),
+                    max_index(route_array, capacities[v_idx], demands),
+                )
+            )
+        if any(python != compiled for python, compiled in checks):
+            mismatches.append(genome)
+    return mismatches
+
+
+@cli.command()
+@click.option("--ins", "instances", multiple=True)
+@click.option("--genomes", default=200, type=int)
+@click.option("--seed", default=0, type=int)
+def parity(instances, genomes, seed):
+    """
+    Checks that the `numba` backend and the batch repair give exactly the same
+    costs and repaired genomes as the python ones on random genomes of every
+    instance.
+    """
+    rng = random.Random(seed)
+    failures = []
+    for instance_type in instances or list_instances():
+        for heterogeneous in (False, True):
+            instance_dict = get_instancer(
+                instance_type, heterogeneous_vehicles=heterogeneous
+            ).get_instance_dict()
+            store_count = len(instance_dict["stores"]) - 1
+            vehicle_count = len(instance_dict["vehicles"])
+            cases = [
+                rng.sample(range(store_count), store_count)
+                + sorted(rng.choices(range(store_count + 1), k=vehicle_count - 1))
+                for _ in range(genomes)
+            ]
+            mismatches = parity_case(instance_dict, cases)
+            name = ("H" if heterogeneous else "") + instance_type.upper()
+            flag = f"{len(mismatches)} MISMATCHES" if mismatches else "ok"
+            click.echo(f"{name:>7} {len(cases)} genomes {flag}")
+            if mismatches:
+                failures.append(name)
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} instances differ between backends: " + ", ".join(failures)
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,108 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from scripts.utils import as_list
+
+CHECKPOINT = "checkpoint.npz"
+
+
+def save_checkpoint(
+    folder, g, pop, all_time_fittest, vehicles, config, elapsed, states=None
+):
+    """
+    Saves everything needed to continue the run after generation `g` as plain
+    numpy arrays in `folder/checkpoint.npz`. The file is written next to the
+    previous one and renamed, a crash never leaves a broken checkpoint behind.
+
+    `states` maps names to objects whose `state()` dict of arrays is saved too,
+    e.g. the stopping rule, and is given back by `load_checkpoint`.
+    """
+    saved_states = {
+        f"{name}.{key}": value
+        for name, obj in (states or {}).items()
+        for key, value in obj.state().items()
+    }
+    version, mt_state, gauss_next = random.getstate()
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    tmp_path = folder / f"{CHECKPOINT}.tmp"
+    with open(tmp_path, "wb") as f_checkpoint:
+        np.savez(
+            f_checkpoint,
+            g=g,
+            config=config,
+            elapsed=elapsed,
+            genomes=np.array([as_list(ind) for ind in pop], dtype=np.int32),
+            fitnesses=np.array([ind.fitness.values[0] for ind in pop]),
+            fittest=np.array(as_list(all_time_fittest), dtype=np.int32),
+            fittest_fitness=all_time_fittest.fitness.values[0],
+            # Same order as `instance["vehicles"]`, which is shuffled per run
+            vehicles=json.dumps(vehicles),
+            random_state=np.array(mt_state, dtype=np.uint32),
+            random_version=version,
+            random_gauss=np.nan if gauss_next is None else gauss_next,
+            numpy_state=keys,
+            numpy_pos=pos,
+            numpy_gauss=(has_gauss, cached_gaussian),
+            **saved_states,
+        )
+    os.replace(tmp_path, folder / CHECKPOINT)
+
+
+def load_checkpoint(folder, config, individual):
+    """
+    Reads `folder/checkpoint.npz`, restores the `random` and `numpy` states and
+    returns `(g, pop, all_time_fittest, vehicles, elapsed, states)`, with the
+    individuals built by `individual` from their genome and `states` as
+    `{name: state}` for the objects to `restore`.
+    """
+    path = folder / CHECKPOINT
+    if not path.exists():
+        raise ValueError(f"No checkpoint found at `{path}`.")
+    with np.load(path) as checkpoint:
+        if str(checkpoint["config"]) != config:
+            raise ValueError(
+                f"Checkpoint is for `{checkpoint['config']}`, not `{config}`."
+            )
+
+        pop = []
+        for genome, fitness in zip(checkpoint["genomes"], checkpoint["fitnesses"]):
+            ind = individual(genome.tolist())
+            ind.fitness.values = (float(fitness),)
+            pop.append(ind)
+        all_time_fittest = individual(checkpoint["fittest"].tolist())
+        all_time_fittest.fitness.values = (float(checkpoint["fittest_fitness"]),)
+
+        gauss = float(checkpoint["random_gauss"])
+        random.setstate(
+            (
+                int(checkpoint["random_version"]),
+                tuple(checkpoint["random_state"].tolist()),
+                None if np.isnan(gauss) else gauss,
+            )
+        )
+        has_gauss, cached_gaussian = checkpoint["numpy_gauss"].tolist()
+        np.random.set_state(
+            (
+                "MT19937",
+                checkpoint["numpy_state"],
+                int(checkpoint["numpy_pos"]),
+                int(has_gauss),
+                cached_gaussian,
+            )
+        )
+        states = {}
+        for key in checkpoint.files:
+            if "." in key:
+                name, state_key = key.split(".", 1)
+                states.setdefault(name, {})[state_key] = checkpoint[key]
+        return (
+            int(checkpoint["g"]),
+            pop,
+            all_time_fittest,
+            json.loads(str(checkpoint["vehicles"])),
+            float(checkpoint["elapsed"]),
+            states,
+        )
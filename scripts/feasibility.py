@@ -0,0 +1,173 @@
+import math
+
+import numpy as np
+
+from scripts.utils import route_vehicles
+
+#
+# Offspring screening. A lower bound of the cost of a whole population matrix
+# takes a few vectorized passes, much less than evaluating it, and offspring
+# whose bound is already far from the best cost found are scored by it instead
+# of being evaluated.
+#
+
+
+def follow_lateness(instance):
+    """
+    `lateness[a, b]` is the least tardiness of store `b` when served right
+    after `a`, whatever happened before `a`, with the depot as `a` when `b`
+    opens a route. Zero where `b` can follow `a` within its time window.
+    """
+    distances = instance["distances"]
+    if not isinstance(distances, np.ndarray):
+        raise ValueError("Screening needs a dense distance matrix.")
+    ready_times = instance["ready_times"]
+    # `a` is left at the earliest once served right at its ready time
+    departures = ready_times + instance["service_times"]
+    departures[-1] = 0
+    starts = np.maximum(departures[:, np.newaxis] + distances, ready_times)
+    return np.maximum(0, starts + instance["service_times"] - instance["due_dates"])
+
+
+def bound_tables(instance):
+    # Everything `cost_bounds` looks up, per pair of stores or per store
+    return {
+        "lateness": follow_lateness(instance),
+        # Travel from `a` to `b` plus the service of `b`
+        "steps": instance["distances"] + instance["service_times"],
+        "openings": instance["ready_times"] + instance["service_times"],
+        "returns": instance["distances"][:, -1],
+        "rates": instance["rates"],
+    }
+
+
+def cost_bounds(genomes, tables):
+    """
+    Lower bound of the cost of every row of a 2-D integer array. Tardiness is
+    bounded pair by pair with the `lateness` table, and the duration of each
+    route by its travel and service times and by the time from the opening of
+    any of its windows back to the depot.
+    """
+    genomes = np.asarray(genomes, dtype=np.int64)
+    store_count = len(tables["returns"]) - 1
+    depot = store_count
+    routes, route_idxs = genomes[:, :store_count], genomes[:, store_count:]
+    vehicle = route_vehicles(route_idxs, store_count)
+    starts = np.ones_like(routes, dtype=bool)
+    starts[:, 1:] = vehicle[:, 1:] != vehicle[:, :-1]
+    ends = np.ones_like(routes, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    prev_stores = np.empty_like(routes)
+    prev_stores[:, 0] = depot
+    prev_stores[:, 1:] = routes[:, :-1]
+    prev_stores[starts] = depot
+
+    # Flat indices of the (previous store, store) pairs in the tables
+    pairs = prev_stores * (store_count + 1) + routes
+    tardiness = np.take(tables["lateness"], pairs).sum(axis=1)
+
+    # Positions where every non empty route starts and ends, flattened
+    route_starts = np.flatnonzero(starts)
+    route_ends = np.flatnonzero(ends)
+    route_of = np.cumsum(starts.ravel()) - 1
+    steps = np.take(tables["steps"], pairs)
+    returns = np.where(ends, tables["returns"][routes], 0)
+    elapsed = (steps + returns).cumsum(axis=1).ravel()
+    # Travel and service left from the departure of each store to the depot
+    remaining = elapsed[route_ends][route_of] - elapsed + returns.ravel()
+    from_windows = np.maximum.reduceat(
+        tables["openings"][routes].ravel() + remaining, route_starts
+    )
+    travel = elapsed[route_ends] - elapsed[route_starts] + steps.ravel()[route_starts]
+    durations = np.maximum(travel, from_windows)
+    rates = tables["rates"][vehicle.ravel()[route_starts]]
+    return tardiness + np.bincount(
+        route_starts // store_count,
+        weights=durations * rates,
+        minlength=len(genomes),
+    )
+
+
+class Screening:
+    """
+    Scores by their lower bound the offspring whose bound is over the best
+    cost evaluated so far by more than `margin` (a fraction). Their fitness is
+    then below their real cost, but still too high to be the best, and it is
+    left out of the population stats.
+    """
+
+    def __init__(self, instance, margin):
+        self.margin = margin
+        self.tables = bound_tables(instance)
+        self.best = math.inf
+        self.screened = self.evaluated = 0
+        # Fitnesses that are bounds, to tell them apart in the stats
+        self.bounds = set()
+
+    def split(self, genomes):
+        # Lower bounds of `genomes` and which of them are worth evaluating
+        bounds = cost_bounds(genomes, self.tables)
+        promising = bounds <= self.best * (1 + self.margin)
+        self.evaluated += int(promising.sum())
+        self.screened += len(bounds) - int(promising.sum())
+        self.bounds.update(bounds[~promising].tolist())
+        return bounds, promising
+
+    def screen_population(self, evaluate_population):
+        # Wraps an `evaluate_population`
+        def screened_evaluate_population(individuals):
+            if not individuals:
+                return []
+            bounds, promising = self.split(np.array(individuals))
+            fitnesses = [(bound,) for bound in bounds.tolist()]
+            idxs = np.flatnonzero(promising).tolist()
+            new_fitnesses = evaluate_population([individuals[idx] for idx in idxs])
+            for idx, fit in zip(idxs, new_fitnesses):
+                fitnesses[idx] = fit
+                self.best = min(self.best, fit[0])
+            return fitnesses
+
+        return screened_evaluate_population
+
+    def screen_genomes(self, evaluate_genomes):
+        # Wraps an `evaluate_genomes`
+        def screened_evaluate_genomes(genomes):
+            costs, promising = self.split(genomes)
+            if promising.any():
+                costs[promising] = evaluate_genomes(genomes[promising])
+                self.best = min(self.best, costs[promising].min())
+            return costs
+
+        return screened_evaluate_genomes
+
+    def screen_stats(self, stats):
+        # Wraps a `population_stats`, the fitness of bound-scored individuals
+        # is given as nan and they are left out of the mean and std
+        def screened_stats(pop):
+            fits = [ind.fitness.values[0] for ind in pop]
+            # Only the bounds still in the population need to be told apart
+            self.bounds.intersection_update(fits)
+            exact = [ind for ind, fit in zip(pop, fits) if fit not in self.bounds]
+            if not exact:
+                return stats(pop)
+            _, mean, std = stats(exact)
+            return [math.nan if fit in self.bounds else fit for fit in fits], mean, std
+
+        return screened_stats
+
+    def state(self):
+        return {
+            "best": self.best,
+            "screened": self.screened,
+            "evaluated": self.evaluated,
+            "bounds": np.array(sorted(self.bounds), dtype=float),
+        }
+
+    def restore(self, state):
+        self.best = float(state["best"])
+        self.screened = int(state["screened"])
+        self.evaluated = int(state["evaluated"])
+        self.bounds = set(state["bounds"].tolist())
+
+    def report(self, name):
+        return f"{name}_screened={self.screened}\n{name}_evaluated={self.evaluated}\n"
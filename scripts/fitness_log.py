@@ -0,0 +1,178 @@
+import importlib.util
+import os
+from ast import literal_eval
+
+import numpy as np
+
+from scripts.utils import as_list
+
+COLUMNS = ("g", "min", "max", "mean", "std")
+# Shards are named by their first generation
+SHARD_PATTERN = "[0-9]*.{}"
+
+
+def check_columnar(columnar):
+    # Fails before a run starts rather than on its first flush
+    if columnar == "parquet" and not any(
+        importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")
+    ):
+        raise ValueError("`--columnar parquet` needs `pyarrow` or `fastparquet`.")
+
+
+def read_columns(folder, columnar):
+    """
+    Stats of every generation saved by a `columnar` `FitnessLog` in `folder`,
+    as a DataFrame with the fittest genome in `ind` where it changed.
+    """
+    import pandas as pd
+
+    shards = sorted(
+        (folder / f"fitness.{columnar}").glob(SHARD_PATTERN.format(columnar))
+    )
+    if columnar == "parquet":
+        return pd.concat([pd.read_parquet(shard) for shard in shards])
+    chunks = []
+    for shard in shards:
+        with np.load(shard) as columns:
+            stats = pd.DataFrame({key: columns[key] for key in COLUMNS})
+            genomes = dict(zip(columns["genome_g"].tolist(), columns["genomes"]))
+        stats["ind"] = [genomes.get(g) for g in stats["g"]]
+        chunks.append(stats)
+    return pd.concat(chunks, ignore_index=True)
+
+
+class FitnessLog:
+    """
+    Streams the stats of every generation to `fitness.csv` in `folder`,
+    flushing every `flush_interval` generations so a crash loses at most that
+    many rows. The fittest genome is only written when it changes, the `ind`
+    column is left empty otherwise.
+
+    `columnar` ("npz" or "parquet") also saves the rows of every flush as a
+    new shard in the `fitness.npz` / `fitness.parquet` folder, see
+    `read_columns`.
+
+    With `start` the existing logs are kept up to generation `start`, excluded,
+    and the new rows follow them.
+    """
+
+    def __init__(self, folder, flush_interval=100, columnar=None, start=0):
+        check_columnar(columnar)
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.columnar = columnar
+        self.rows = []
+        self.last_genome = None
+        self.clear_columns()
+        if columnar:
+            self.shards = folder / f"fitness.{columnar}"
+            self.shards.mkdir(exist_ok=True)
+        if start:
+            self.resume(start)
+        else:
+            self.file = open(folder / "fitness.csv", "w+")
+            self.file.write("g,min,max,mean,std,ind\n")
+
+    def clear_columns(self):
+        # Only the rows since the last flush are kept
+        self.columns = {key: [] for key in COLUMNS}
+        self.genomes, self.genome_gens = [], []
+
+    def resume(self, start):
+        self.file = open(self.folder / "fitness.csv", "r+")
+        # Rows written after the checkpoint are dropped, they will be redone
+        self.file.readline()
+        while True:
+            position = self.file.tell()
+            line = self.file.readline()
+            if not line or int(line.split(",", 1)[0]) >= start:
+                break
+            genome = line.split(",", 5)[5].strip().strip('"')
+            if genome:
+                self.last_genome = genome
+        self.file.seek(position)
+        self.file.truncate()
+        if self.last_genome is not None:
+            self.last_genome = literal_eval(self.last_genome)
+
+        if self.columnar:
+            for shard in sorted(self.shards.glob(SHARD_PATTERN.format(self.columnar))):
+                if int(shard.name.split(".")[0]) >= start:
+                    shard.unlink()
+                else:
+                    self.trim_shard(shard, start)
+
+    def trim_shard(self, shard, start):
+        # Rewrites `shard` without the rows from generation `start` on
+        if self.columnar == "npz":
+            with np.load(shard) as columns:
+                if columns["g"][-1] < start:
+                    return
+                kept = columns["g"] < start
+                self.columns = {key: columns[key][kept].tolist() for key in COLUMNS}
+                kept = columns["genome_g"] < start
+                self.genomes = columns["genomes"][kept].tolist()
+                self.genome_gens = columns["genome_g"][kept].tolist()
+        else:
+            import pandas as pd
+
+            stats = pd.read_parquet(shard)
+            if stats["g"].iloc[-1] < start:
+                return
+            stats = stats[stats["g"] < start]
+            self.columns = {key: stats[key].tolist() for key in COLUMNS}
+            genomes = stats.dropna(subset=["ind"])
+            self.genomes = [list(genome) for genome in genomes["ind"]]
+            self.genome_gens = genomes["g"].tolist()
+        shard.unlink()
+        self.write_columns()
+
+    def append(self, g, fits_min, fits_max, mean, std, ind):
+        genome = as_list(ind)
+        changed = genome != self.last_genome
+        if changed:
+            self.last_genome = genome
+            if self.columnar:
+                self.genomes.append(genome)
+                self.genome_gens.append(g)
+        self.rows.append(
+            f"{g},{fits_min:.5f},{fits_max:.5f},{mean:.5f},{std:.5f},"
+            f'"{genome if changed else ""}"\n'
+        )
+        if self.columnar:
+            for key, value in zip(self.columns, (g, fits_min, fits_max, mean, std)):
+                self.columns[key].append(value)
+        if len(self.rows) >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.writelines(self.rows)
+        self.file.flush()
+        self.rows = []
+        if self.columnar and self.columns["g"]:
+            self.write_columns()
+
+    def write_columns(self):
+        path = self.shards / f"{self.columns['g'][0]:08d}.{self.columnar}"
+        # Written next to the final file and renamed, a reader never sees half
+        tmp_path = self.shards / f"tmp.{self.columnar}"
+        if self.columnar == "npz":
+            np.savez(
+                tmp_path,
+                genomes=np.array(self.genomes, dtype=np.int32),
+                genome_g=np.array(self.genome_gens, dtype=int),
+                **{key: np.array(values) for key, values in self.columns.items()},
+            )
+        else:
+            import pandas as pd
+
+            stats = pd.DataFrame(self.columns)
+            genomes = dict(zip(self.genome_gens, self.genomes))
+            stats["ind"] = [genomes.get(g) for g in self.columns["g"]]
+            stats.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        self.clear_columns()
+
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -0,0 +1,39 @@
+import copy
+
+import numpy as np
+from deap import creator
+
+#
+# Array backed individual. The genome lives in one contiguous int32 buffer, so
+# part 1 and part 2 slices are views and cloning is a single buffer copy.
+#
+
+
+class ArrayIndividual(np.ndarray):
+    __slots__ = ("fitness", "route_cache")
+
+    def __new__(cls, genome):
+        ind = np.array(genome, dtype=np.int32).view(cls)
+        ind.fitness = creator.FitnessMin()
+        return ind
+
+    def __deepcopy__(self, memo):
+        clone = np.ndarray.copy(self)
+        clone.fitness = copy.deepcopy(self.fitness, memo)
+        # Route caches are never edited in place, share it with the clone
+        if hasattr(self, "route_cache"):
+            clone.route_cache = self.route_cache
+        return clone
+
+    def __reduce__(self):
+        return (_rebuild, (self.tolist(), self.fitness))
+
+    def __str__(self):
+        # Same output as list individuals, results files are parsed back
+        return str(self.tolist())
+
+
+def _rebuild(genome, fitness):
+    ind = ArrayIndividual(genome)
+    ind.fitness = fitness
+    return ind
@@ -0,0 +1,108 @@
+import cProfile
+import time
+from collections import defaultdict
+
+# Toolbox operators timed on every generation
+PHASES = [
+    "select",
+    "clone",
+    "mate_1",
+    "mutate_swap",
+    "mutate_inc",
+    "mutate_dec",
+    "correct_population",
+    "evaluate_population",
+    "correct_genomes",
+    "evaluate_genomes",
+    "local_search",
+    "stats",
+    "draw",
+]
+
+
+def timed(func, name, timings):
+    def timed_func(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[name] += time.perf_counter() - start
+
+    return timed_func
+
+
+def time_operators(toolbox, names=PHASES):
+    """
+    Wraps the `names` toolbox operators so every call adds its duration to the
+    returned dict. Operators that are not wrapped pay nothing.
+    """
+    timings = defaultdict(float)
+    for name in names:
+        toolbox.register(name, timed(getattr(toolbox, name), name, timings))
+    return timings
+
+
+class PhaseLog:
+    """
+    Writes the seconds spent on every phase of each generation as a csv row.
+    """
+
+    def __init__(self, path, timings, phases=PHASES):
+        self.timings = timings
+        self.phases = phases
+        self.file = open(path, "w+")
+        self.file.write("g," + ",".join(phases) + "\n")
+
+    def write(self, g):
+        row = ",".join(f"{self.timings[phase]:.6f}" for phase in self.phases)
+        self.file.write(f"{g},{row}\n")
+        self.timings.clear()
+
+    def close(self):
+        self.file.close()
+
+
+class GenerationProfiler:
+    """
+    Profiles the generations in `window` ("start:finish", finish excluded) with
+    cProfile or pyinstrument and saves the result in `output_folder`.
+    """
+
+    def __init__(self, window, output_folder, profiler="cprofile"):
+        start, finish = window.split(":")
+        self.start, self.finish = int(start), int(finish)
+        self.output_folder = output_folder
+        self.kind = profiler
+        if profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ValueError("`pyinstrument` is not installed.")
+            self.profiler = Profiler()
+        else:
+            self.profiler = cProfile.Profile()
+        self.running = False
+
+    def step(self, g):
+        # Called at the start of generation `g`
+        if g == self.start:
+            self.running = True
+            if self.kind == "pyinstrument":
+                self.profiler.start()
+            else:
+                self.profiler.enable()
+        elif g == self.finish:
+            self.stop()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        name = f"profile_{self.start}_{self.finish}"
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+            with open(self.output_folder / f"{name}.html", "w+") as f_profile:
+                f_profile.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output_folder / f"{name}.prof")
@@ -0,0 +1,268 @@
+import multiprocessing
+import queue
+import random
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+from deap import creator, tools
+
+from scripts.fitness_log import FitnessLog
+from scripts.main import (
+    create_instrumentation,
+    create_stopping_rule,
+    create_toolbox,
+    evaluate_invalid,
+    evolve,
+    write_result,
+)
+from scripts.utils import as_list, create_types
+
+#
+# Island model: independent populations that exchange their best individuals
+# every `migration_interval` generations through multiprocessing queues.
+#
+
+
+def island_neighbours(island_idx, island_count, topology="ring"):
+    if topology == "ring":
+        return [(island_idx + 1) % island_count]
+    return [idx for idx in range(island_count) if idx != island_idx]
+
+
+def emigrate(pop, outboxes, migrants):
+    emigrants = [
+        (as_list(ind), ind.fitness.values) for ind in tools.selBest(pop, migrants)
+    ]
+    for outbox in outboxes:
+        outbox.put(emigrants)
+
+
+def immigrate(pop, inbox):
+    # Never blocks, islands do not wait for each other
+    immigrants = []
+    while True:
+        try:
+            immigrants.extend(inbox.get_nowait())
+        except queue.Empty:
+            break
+    # Immigrants replace the worst individuals of the island
+    immigrants = immigrants[: len(pop) - 1]
+    worst = np.argsort([ind.fitness.values[0] for ind in pop])[::-1]
+    for pop_idx, (genome, values) in zip(worst, immigrants):
+        ind = type(pop[pop_idx])(genome)
+        ind.fitness.values = values
+        pop[pop_idx] = ind
+    return pop
+
+
+def run_island(
+    island_idx, seed, options, instance, instance_dict, inbox, outboxes, done, results
+):
+    # The parent waits on `results`, so failures must be reported there too
+    try:
+        result = evolve_island(
+            island_idx, seed, options, instance, instance_dict, inbox, outboxes, done
+        )
+    except Exception:
+        results.put((island_idx, traceback.format_exc(), None))
+    else:
+        results.put((island_idx, None, result))
+    finally:
+        # Neighbours may be done already, do not wait for them to read migrants
+        for outbox in outboxes:
+            outbox.cancel_join_thread()
+
+
+def evolve_island(
+    island_idx, seed, options, instance, instance_dict, inbox, outboxes, done
+):
+    random.seed(seed)
+    np.random.seed(seed)
+    toolbox, _ = create_toolbox(
+        options["ins"],
+        heterogeneous_vehicles=options["h"],
+        part2_type=options["part2_type"],
+        evaluator=options["evaluator"],
+        instance_dict=instance_dict,
+        genome=options["genome"],
+        decoder=options["decoder"],
+        split_lookahead=options["split_lookahead"],
+        fitness_cache=options["fitness_cache"],
+        route_cache=options["route_cache"],
+        selection=options["selection"],
+        local_search=options["local_search"],
+        local_search_rate=options["local_search_rate"],
+        neighbours=options["neighbours"],
+        backend=options["backend"],
+        engine=options["engine"],
+        screen_margin=options["screen_margin"],
+        instancer=instance,
+    )
+    start = time.time()
+    pop = toolbox.population(n=options["pop_size"])
+    evaluate_invalid(toolbox, pop)
+
+    fits = [ind.fitness.values[0] for ind in pop]
+    all_time_fittest = pop[np.argmin(fits)]
+    time_to_best = time.time() - start
+
+    analysis_folder = (
+        Path(options["output_folder"]) / f"island{island_idx}" / "analysis"
+    )
+    analysis_folder.mkdir(parents=True)
+    fitness_log = FitnessLog(
+        analysis_folder,
+        flush_interval=options["flush_interval"],
+        columnar=options["columnar"],
+    )
+    phase_log, generation_profiler = create_instrumentation(
+        toolbox, options, analysis_folder
+    )
+
+    def migrate(g, pop):
+        if (g + 1) % options["migration_interval"] == 0:
+            emigrate(pop, outboxes, options["migrants"])
+            pop = immigrate(pop, inbox)
+        return pop
+
+    def after_generation(g, pop, fittest, stop_reason):
+        nonlocal best, time_to_best
+        if fittest.fitness.values[0] < best:
+            best, time_to_best = fittest.fitness.values[0], time.time() - start
+        # The run is over once any island reaches the target cost
+        if stop_reason == "target":
+            done.set()
+        elif done.is_set():
+            return "target_elsewhere"
+        return None
+
+    best = all_time_fittest.fitness.values[0]
+    _, all_time_fittest, g, stop_reason = evolve(
+        toolbox,
+        pop,
+        all_time_fittest,
+        options,
+        fitness_log,
+        create_stopping_rule(options),
+        start,
+        migrate=migrate,
+        after_generation=after_generation,
+        generation_profiler=generation_profiler,
+        phase_log=phase_log,
+    )
+    fitness_log.close()
+    if phase_log:
+        phase_log.close()
+    if generation_profiler:
+        generation_profiler.stop()
+    toolbox.shutdown()
+    return (
+        as_list(all_time_fittest),
+        all_time_fittest.fitness.values,
+        time_to_best,
+        time.time() - start,
+        stop_reason or "rounds",
+        g + 1,
+    )
+
+
+def collect_results(results, processes):
+    """
+    One result per island process, in island order. When an island fails, or
+    dies without reporting, the others are terminated and the error raised.
+    """
+    island_results = {}
+    error = None
+    while error is None and len(island_results) < len(processes):
+        try:
+            island_idx, error, result = results.get(timeout=1)
+            island_results[island_idx] = result
+        except queue.Empty:
+            for island_idx, process in enumerate(processes):
+                if island_idx not in island_results and process.exitcode:
+                    error = f"Exited with code {process.exitcode}."
+                    break
+    if error is not None:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise RuntimeError(f"Island {island_idx} failed:\n{error}")
+    return [island_results[idx] for idx in range(len(processes))]
+
+
+def run_islands(options, instance, islands, topology, start_method=None):
+    """
+    Evolves `islands` populations in their own processes and writes the best
+    individual among all of them as the run result. They all stop once one of
+    them reaches `target_cost`. Returns the best individual, the elapsed
+    seconds, the seconds to the target cost, if reached, and why and after
+    how many generations the run stopped.
+    """
+    create_types()
+    context = multiprocessing.get_context(start_method)
+    # Every island shares the same vehicle order so migrants keep their meaning
+    instance_dict = instance.get_instance_dict()
+    output_folder = Path(options["output_folder"])
+
+    start = time.time()
+    inboxes = [context.Queue() for _ in range(islands)]
+    done = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_island,
+            args=(
+                island_idx,
+                random.randrange(2**32),
+                options,
+                instance,
+                instance_dict,
+                inboxes[island_idx],
+                [
+                    inboxes[idx]
+                    for idx in island_neighbours(island_idx, islands, topology)
+                ],
+                done,
+                results,
+            ),
+        )
+        for island_idx in range(islands)
+    ]
+    for process in processes:
+        process.start()
+    island_results = collect_results(results, processes)
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start
+
+    with open(output_folder / "analysis" / "islands.csv", "w+") as f_islands:
+        f_islands.write("island,best,time_to_best,elapsed,stop_reason,generations\n")
+        for island_idx, result in enumerate(island_results):
+            _, values, time_to_best, island_elapsed, stop_reason, generations = result
+            f_islands.write(
+                f"{island_idx},{values[0]:.5f},{time_to_best:.2f},"
+                f"{island_elapsed:.2f},{stop_reason},{generations}\n"
+            )
+    # When the first island reached `target_cost`, from its own start
+    time_to_target = min(
+        (result[2] for result in island_results if result[4] == "target"),
+        default=None,
+    )
+    # The run stops with the island that reached the target, else the last one
+    *_, stop_reason, generations = max(
+        island_results, key=lambda result: (result[4] == "target", result[5])
+    )
+
+    genome, values, *_ = min(island_results, key=lambda result: result[1])
+    best = creator.Individual(genome)
+    best.fitness.values = values
+    write_result(
+        output_folder / "result.txt",
+        best,
+        len(instance.stores) - 1,
+        instance_dict["vehicles"] if options["h"] else None,
+    )
+    return best, elapsed, time_to_target, stop_reason, generations
@@ -0,0 +1,220 @@
+import numpy as np
+
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # Without numba the kernels are plain Python over the same arrays
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+#
+# Compiled backend. Kernels only take flat numpy arrays, built once per
+# instance by `instance_arrays`, and are compiled with `numba` in nopython mode
+# and cached to disk, so only the first run on a machine pays the JIT time.
+# They follow the pure-Python versions operation by operation, so both
+# backends return the same costs and genomes.
+#
+
+
+def instance_arrays(instance):
+    """
+    The instance data used by the kernels: distance matrix, ready times, due
+    dates, service times and demands per store, capacities and rates per
+    vehicle, all contiguous float64 arrays.
+    """
+    if not isinstance(instance["distances"], np.ndarray):
+        raise ValueError("The compiled backend needs a dense distance matrix.")
+    return tuple(
+        np.ascontiguousarray(instance[key], dtype=np.float64)
+        for key in (
+            "distances",
+            "ready_times",
+            "due_dates",
+            "service_times",
+            "demands",
+            "capacities",
+            "rates",
+        )
+    )
+
+
+@njit(cache=True)
+def route_cost(
+    genome, start, finish, rate, distances, ready_times, due_dates, service_times
+):
+    # `eval_route_matrix` of the route `genome[start:finish]`
+    depot = len(distances) - 1
+    t = 0.0
+    cost = 0.0
+    prev_store = depot
+    for idx in range(start, finish):
+        store = genome[idx]
+        t += distances[prev_store, store]
+        if t < ready_times[store]:
+            t = ready_times[store]
+        t += service_times[store]
+        if t - due_dates[store] > 0:
+            cost += t - due_dates[store]
+        prev_store = store
+    t += distances[prev_store, depot]
+    return cost + t * rate
+
+
+@njit(cache=True)
+def genome_cost(
+    genome, store_count, rates, distances, ready_times, due_dates, service_times
+):
+    # `eval_routes` of a whole genome
+    cost = 0.0
+    route_start_idx = 0
+    for v_idx in range(len(genome) - store_count + 1):
+        if v_idx < len(genome) - store_count:
+            route_finish_idx = genome[store_count + v_idx]
+        else:
+            route_finish_idx = store_count
+        cost += route_cost(
+            genome,
+            route_start_idx,
+            route_finish_idx,
+            rates[v_idx],
+            distances,
+            ready_times,
+            due_dates,
+            service_times,
+        )
+        route_start_idx = route_finish_idx
+    return cost
+
+
+@njit(cache=True)
+def min_index(route, capacity, demands):
+    # `find_min_index`: stores that fit in the vehicle from the start
+    route_demand = 0.0
+    for idx in range(len(route)):
+        route_demand += demands[route[idx]]
+        if route_demand > capacity:
+            return idx
+    return len(route)
+
+
+@njit(cache=True)
+def max_index(route, capacity, demands):
+    # `find_max_index`: first store that fits in the vehicle up to the end
+    route_demand = 0.0
+    for r_idx in range(len(route)):
+        route_demand += demands[route[len(route) - 1 - r_idx]]
+        if route_demand > capacity:
+            return len(route) - r_idx
+    return 0
+
+
+@njit(cache=True)
+def repair_genome(genome, store_count, capacities, demands):
+    # `correct_route`, with the same binary searches over the prefix sums
+    repaired = genome.copy()
+    route_count = len(genome) - store_count
+    prefix = np.zeros(store_count + 1)
+    for idx in range(store_count):
+        prefix[idx + 1] = prefix[idx] + demands[genome[idx]]
+
+    route_start_idx = 0
+    for vehicle_idx in range(route_count):
+        route_finish_idx = genome[store_count + vehicle_idx]
+        max_demand = prefix[route_start_idx] + capacities[vehicle_idx]
+        fit_idx = (
+            route_start_idx
+            + np.searchsorted(prefix[route_start_idx:], max_demand, side="right")
+            - 1
+        )
+        route_start_idx = max(route_start_idx, min(route_finish_idx, fit_idx))
+        repaired[store_count + vehicle_idx] = route_start_idx
+
+    route_finish_idx = store_count
+    for vehicle_idx in range(route_count, 0, -1):
+        min_demand = prefix[route_finish_idx] - capacities[vehicle_idx]
+        fit_idx = np.searchsorted(prefix[:route_finish_idx], min_demand, side="left")
+        route_finish_idx = max(repaired[store_count + vehicle_idx - 1], fit_idx)
+        repaired[store_count + vehicle_idx - 1] = route_finish_idx
+    return repaired
+
+
+@njit(cache=True)
+def population_cost(
+    genomes, store_count, rates, distances, ready_times, due_dates, service_times
+):
+    costs = np.empty(len(genomes))
+    for row in range(len(genomes)):
+        costs[row] = genome_cost(
+            genomes[row],
+            store_count,
+            rates,
+            distances,
+            ready_times,
+            due_dates,
+            service_times,
+        )
+    return costs
+
+
+@njit(cache=True)
+def repair_population(genomes, store_count, capacities, demands):
+    for row in range(len(genomes)):
+        genomes[row] = repair_genome(genomes[row], store_count, capacities, demands)
+    return genomes
+
+
+#
+# Toolbox wrappers, same signatures as their pure-Python counterparts plus the
+# arrays of `instance_arrays`.
+#
+
+
+def eval_routes_compiled(individual, instance=None, arrays=None):
+    distances, ready_times, due_dates, service_times, _, _, rates = arrays
+    genome = np.asarray(individual, dtype=np.int64)
+    return (
+        genome_cost(
+            genome,
+            len(distances) - 1,
+            rates,
+            distances,
+            ready_times,
+            due_dates,
+            service_times,
+        ),
+    )
+
+
+def correct_route_compiled(store_count, instance, ind, arrays=None):
+    _, _, _, _, demands, capacities, _ = arrays
+    genome = np.asarray(ind, dtype=np.int64)
+    return repair_genome(genome, store_count, capacities, demands).tolist()
+
+
+def eval_genomes_compiled(genomes, instance=None, arrays=None):
+    distances, ready_times, due_dates, service_times, _, _, rates = arrays
+    return population_cost(
+        np.asarray(genomes, dtype=np.int64),
+        len(distances) - 1,
+        rates,
+        distances,
+        ready_times,
+        due_dates,
+        service_times,
+    )
+
+
+def correct_genomes_compiled(store_count, instance, genomes, arrays=None):
+    # In place, as `correct_genomes`
+    _, _, _, _, demands, capacities, _ = arrays
+    genomes[:] = repair_population(
+        np.asarray(genomes, dtype=np.int64), store_count, capacities, demands
+    )
+    return genomes
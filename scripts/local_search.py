@@ -0,0 +1,291 @@
+import math
+import random
+from itertools import accumulate
+
+import numpy as np
+
+from scripts.utils import as_list
+
+#
+# Memetic step: first improvement local search over the decoded routes with
+# 2-opt, Or-opt, relocate and exchange moves. Candidate moves only join a store
+# with one of its nearest neighbours, and most of them are costed in constant
+# time from the forward time slack of the untouched end of the route.
+#
+# Time windows are soft here (late stores add tardiness), so the slack is the
+# delay a route suffix absorbs without any extra tardiness. A move that delays
+# the suffix by more than that, or makes it start earlier, walks the suffix.
+#
+
+IMPROVEMENT = 1e-7
+
+
+def neighbour_lists(instance, k=10, block_size=2_000_000):
+    """
+    The `k` closest stores of every store, the depot left out. Distances are
+    computed a block of rows at a time, so no full matrix is ever built.
+    """
+    positions = instance["positions"][:-1]
+    store_count = len(positions)
+    k = min(k, store_count - 1)
+    rows = max(1, block_size // store_count)
+    neighbours = []
+    for start in range(0, store_count, rows):
+        block = positions[start : start + rows]
+        deltas = positions[np.newaxis, :, :] - block[:, np.newaxis, :]
+        distances = np.sqrt((deltas**2).sum(axis=-1))
+        distances[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        # Every store as close as the k-th one, ties are kept in index order
+        limits = np.partition(distances, k - 1, axis=1)[:, k - 1]
+        for row, limit in zip(distances, limits):
+            candidates = np.flatnonzero(row <= limit)
+            order = np.argsort(row[candidates], kind="stable")[:k]
+            neighbours.append(candidates[order].tolist())
+    return neighbours
+
+
+class RouteState:
+    """
+    Service start, departure and accumulated tardiness at every store of a
+    route, with the slack and the waiting left after each of them.
+    """
+
+    __slots__ = ("route", "starts", "departures", "tardiness", "slack", "waits", "end")
+
+    def __init__(self, route, lookup):
+        distances = lookup["distances"]
+        ready_times = lookup["ready_times"]
+        due_dates = lookup["due_dates"]
+        service_times = lookup["service_times"]
+        self.route = route
+        self.starts, self.departures, self.tardiness = [], [], []
+        waits = []
+
+        t = cost = 0
+        prev_store = depot = len(distances) - 1
+        for store in route:
+            arrival = t + distances[prev_store][store]
+            start = arrival if arrival > ready_times[store] else ready_times[store]
+            t = start + service_times[store]
+            cost += max(0, t - due_dates[store])
+            self.starts.append(start)
+            self.departures.append(t)
+            self.tardiness.append(cost)
+            waits.append(start - arrival)
+            prev_store = store
+        self.end = t + distances[prev_store][depot]
+
+        # slack[j]: delay of the service start of `j` that adds no tardiness
+        # waits[j]: waiting time after `j`, a delay beyond it reaches the depot
+        self.slack, self.waits = [0] * len(route), [0] * len(route)
+        next_slack, next_wait = math.inf, 0
+        for idx in range(len(route) - 1, -1, -1):
+            own_slack = max(0, due_dates[route[idx]] - self.departures[idx])
+            self.slack[idx] = min(own_slack, next_slack)
+            self.waits[idx] = next_wait
+            next_slack = waits[idx] + self.slack[idx]
+            next_wait = waits[idx] + self.waits[idx]
+
+    def cost(self, rate):
+        return (self.tardiness[-1] if self.route else 0) + self.end * rate
+
+
+def compose_cost(head, head_len, middle, tail, tail_start, rate, lookup):
+    """
+    Cost of the route `head.route[:head_len] + middle + tail.route[tail_start:]`
+    for a vehicle with `rate`.
+    """
+    distances = lookup["distances"]
+    ready_times = lookup["ready_times"]
+    due_dates = lookup["due_dates"]
+    service_times = lookup["service_times"]
+
+    depot = len(distances) - 1
+    if head_len:
+        t = head.departures[head_len - 1]
+        cost = head.tardiness[head_len - 1]
+        prev_store = head.route[head_len - 1]
+    else:
+        t = cost = 0
+        prev_store = depot
+    for store in middle:
+        t += distances[prev_store][store]
+        if t < ready_times[store]:
+            t = ready_times[store]
+        t += service_times[store]
+        cost += max(0, t - due_dates[store])
+        prev_store = store
+
+    route = tail.route
+    if tail_start < len(route):
+        first = route[tail_start]
+        start = t + distances[prev_store][first]
+        if start < ready_times[first]:
+            start = ready_times[first]
+        delay = start - tail.starts[tail_start]
+        if 0 <= delay <= tail.slack[tail_start]:
+            # Same tardiness as before, the delay left reaches the depot
+            cost += tail.tardiness[-1]
+            if tail_start:
+                cost -= tail.tardiness[tail_start - 1]
+            return cost + rate * (tail.end + max(0, delay - tail.waits[tail_start]))
+        for store in route[tail_start:]:
+            t += distances[prev_store][store]
+            if t < ready_times[store]:
+                t = ready_times[store]
+            t += service_times[store]
+            cost += max(0, t - due_dates[store])
+            prev_store = store
+
+    return cost + rate * (t + distances[prev_store][depot])
+
+
+class LocalSearch:
+    """
+    Routes of one individual, one per vehicle, with the state needed to cost
+    moves. Capacities and rates are the ones of each vehicle.
+    """
+
+    def __init__(self, store_count, instance, genome, neighbours):
+        self.lookup = instance["lookup"]
+        self.neighbours = neighbours
+        self.capacities = self.lookup["capacities"]
+        self.rates = self.lookup["rates"]
+        self.demands = self.lookup["demands"]
+
+        routes, route_idxs = genome[:store_count], genome[store_count:]
+        route_starts = [0, *route_idxs]
+        route_finishes = [*route_idxs, store_count]
+        self.states, self.loads, self.costs = [], [], []
+        self.positions = [None] * store_count
+        for v_idx, (start, finish) in enumerate(zip(route_starts, route_finishes)):
+            self.states.append(None)
+            self.loads.append(0)
+            self.costs.append(0)
+            self.update(v_idx, routes[start:finish])
+
+    def update(self, v_idx, route):
+        state = RouteState(route, self.lookup)
+        self.states[v_idx] = state
+        self.loads[v_idx] = sum(map(self.demands.__getitem__, route))
+        self.costs[v_idx] = state.cost(self.rates[v_idx])
+        for idx, store in enumerate(route):
+            self.positions[store] = (v_idx, idx)
+
+    def genome(self):
+        routes = [state.route for state in self.states]
+        route_idxs = list(accumulate(len(route) for route in routes[:-1]))
+        return [store for route in routes for store in route] + route_idxs
+
+    def cost(self, v_idx, head_len, middle, tail_start):
+        state = self.states[v_idx]
+        return compose_cost(
+            state, head_len, middle, state, tail_start, self.rates[v_idx], self.lookup
+        )
+
+    def improve_store(self, u):
+        """
+        Applies the first improving move that joins `u` with one of its
+        neighbours. Returns whether a move was applied.
+        """
+        a_idx, i = self.positions[u]
+        route_a = self.states[a_idx].route
+        demand_u = self.demands[u]
+
+        for v in self.neighbours[u]:
+            b_idx, p = self.positions[v]
+            if b_idx == a_idx:
+                # 2-opt, reverse the stores between `u` and `v` so they connect
+                if p > i + 1:
+                    middle = route_a[i + 1 : p + 1][::-1]
+                    if self.cost(a_idx, i + 1, middle, p + 1) < (
+                        self.costs[a_idx] - IMPROVEMENT
+                    ):
+                        new_route = route_a[: i + 1] + middle + route_a[p + 1 :]
+                        self.update(a_idx, new_route)
+                        return True
+                # Or-opt, move up to 3 stores starting at `u` right after `v`
+                for length in (1, 2, 3):
+                    if i + length > len(route_a) or i <= p < i + length:
+                        break
+                    segment = route_a[i : i + length]
+                    if p < i:
+                        head_len, tail_start = p + 1, i + length
+                        middle = segment + route_a[p + 1 : i]
+                    else:
+                        head_len, tail_start = i, p + 1
+                        middle = route_a[i + length : p + 1] + segment
+                    if self.cost(a_idx, head_len, middle, tail_start) < (
+                        self.costs[a_idx] - IMPROVEMENT
+                    ):
+                        new_route = route_a[:head_len] + middle + route_a[tail_start:]
+                        self.update(a_idx, new_route)
+                        return True
+                continue
+
+            route_b = self.states[b_idx].route
+            demand_v = self.demands[v]
+            current = self.costs[a_idx] + self.costs[b_idx] - IMPROVEMENT
+            # Relocate `u` right before or after `v`
+            if self.loads[b_idx] + demand_u <= self.capacities[b_idx]:
+                removed = self.cost(a_idx, i, [], i + 1)
+                for q in (p, p + 1):
+                    if removed + self.cost(b_idx, q, [u], q) < current:
+                        self.update(a_idx, route_a[:i] + route_a[i + 1 :])
+                        self.update(b_idx, route_b[:q] + [u] + route_b[q:])
+                        return True
+            # Exchange `u` and `v`
+            if (
+                self.loads[a_idx] - demand_u + demand_v <= self.capacities[a_idx]
+                and self.loads[b_idx] - demand_v + demand_u <= self.capacities[b_idx]
+            ):
+                new_cost = self.cost(a_idx, i, [v], i + 1)
+                new_cost += self.cost(b_idx, p, [u], p + 1)
+                if new_cost < current:
+                    self.update(a_idx, route_a[:i] + [v] + route_a[i + 1 :])
+                    self.update(b_idx, route_b[:p] + [u] + route_b[p + 1 :])
+                    return True
+        return False
+
+
+def local_search(store_count, instance, ind, neighbours):
+    """
+    Improves `ind` in place until no move improves it. Returns whether it
+    changed, in which case its fitness is invalidated.
+    """
+    genome = as_list(ind)
+    search = LocalSearch(store_count, instance, genome, neighbours)
+    improved = True
+    while improved:
+        improved = False
+        for u in range(store_count):
+            while search.improve_store(u):
+                improved = True
+
+    new_genome = search.genome()
+    if new_genome == genome:
+        return False
+    ind[:] = new_genome
+    del ind.fitness.values
+    return True
+
+
+def local_search_population(
+    store_count, instance, individuals, neighbours, mode="elite", rate=0.1
+):
+    """
+    Memetic step over the newly evaluated `individuals`: either the fittest of
+    them (`elite`) or a `rate` fraction picked at random (`offspring`). Returns
+    the individuals that changed.
+    """
+    individuals = [ind for ind in individuals if ind.fitness.valid]
+    if not individuals:
+        return []
+    if mode == "elite":
+        targets = [min(individuals, key=lambda ind: ind.fitness.values[0])]
+    else:
+        count = min(len(individuals), math.ceil(rate * len(individuals)))
+        targets = random.sample(individuals, count)
+    return [
+        ind for ind in targets if local_search(store_count, instance, ind, neighbours)
+    ]
@@ -7,46 +7,162 @@ from pathlib import Path
 import click
 import numpy as np
 from deap import base, creator, tools
-from tqdm import tqdm
 
-from instances.parser import Instancer
+from instances.parser import get_instancer
+from scripts.checkpoint import load_checkpoint, save_checkpoint
+from scripts.feasibility import Screening
+from scripts.fitness_log import FitnessLog, check_columnar
+from scripts.genome import ArrayIndividual
+from scripts.instrumentation import GenerationProfiler, PhaseLog, time_operators
+from scripts.local_search import local_search_population, neighbour_lists
+from scripts.matrix_engine import next_generation_matrix
+from scripts.memo import LRUCache, eval_routes_memo, memoize_population
+from scripts.parallel import create_pool, pool_correct, pool_evaluate
+from scripts.plotting import BackgroundDrawer
+from scripts.shared import SharedPool
+from scripts.split import split_routes
+from scripts.stopping import StoppingRule, adaptive_rates
 from scripts.utils import (
+    as_list,
+    correct_genomes,
+    correct_population,
     correct_route,
+    create_types,
     dec_op,
     draw_individual,
+    eval_genomes,
+    eval_population,
     eval_routes,
+    eval_routes_delta,
     inc_op,
     init_iterate_and_distribute,
+    logger,
     part_one_edit,
     part_two_edit,
     regenerate_op,
     reverse_op,
     selInverseRoulette,
+    selInverseSUS,
+    selTournamentArray,
     swap_op,
 )
 
 
-def create_toolbox(instance_type, heterogeneous_vehicles, part2_type="greedy"):
-    current_instance = Instancer(
+def create_toolbox(
+    instance_type,
+    heterogeneous_vehicles,
+    part2_type="greedy",
+    evaluator="matrix",
+    workers=1,
+    start_method=None,
+    instance_dict=None,
+    genome="list",
+    decoder="repair",
+    split_lookahead=None,
+    fitness_cache=0,
+    route_cache=0,
+    selection="tournament",
+    local_search="off",
+    local_search_rate=0.1,
+    neighbours=10,
+    backend="python",
+    engine="deap",
+    screen_margin=None,
+    shared_memory=False,
+    instancer=None,
+):
+    # An instancer built by the caller is reused, its arrays are not cheap
+    current_instance = instancer or get_instancer(
         instance_type, heterogeneous_vehicles=heterogeneous_vehicles
     )
-    instance_dict = current_instance.get_instance_dict()
+    # Processes that exchange individuals must share the same vehicle order
+    if instance_dict is None:
+        instance_dict = current_instance.get_instance_dict()
+
+    create_types()
+
+    arrays = None
+    if backend == "numba":
+        # Only imported when asked for, `numba` takes long to import
+        from scripts.kernels import (
+            HAVE_NUMBA,
+            correct_genomes_compiled,
+            correct_route_compiled,
+            eval_genomes_compiled,
+            eval_routes_compiled,
+            instance_arrays,
+        )
 
-    creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
-    creator.create("Individual", list, fitness=creator.FitnessMin)
+        if evaluator != "matrix" or route_cache:
+            raise ValueError(
+                "The `numba` backend needs the `matrix` evaluator and no `route_cache`."
+            )
+        if HAVE_NUMBA:
+            arrays = instance_arrays(instance_dict)
+        else:
+            logger.warning("numba is not installed, using the python backend.")
+    if engine == "matrix" and (
+        decoder != "repair"
+        or (workers > 1 and not shared_memory)
+        or fitness_cache
+        or route_cache
+    ):
+        raise ValueError(
+            "The `matrix` engine needs the `repair` decoder, no caches and either "
+            "a single worker or `shared_memory`."
+        )
+
+    # Part 2 is either repaired greedily or recomputed by the optimal split
+    if decoder == "split":
+        repair = partial(split_routes, lookahead=split_lookahead)
+    elif arrays is not None:
+        repair = partial(correct_route_compiled, arrays=arrays)
+    else:
+        repair = correct_route
 
     toolbox = base.Toolbox()
     # Structure initializers
     toolbox.register(
         "individual",
         init_iterate_and_distribute,
-        creator.Individual,
+        ArrayIndividual if genome == "array" else creator.Individual,
         instance=instance_dict,
         part2_type=part2_type,
+        repair=repair,
     )
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
-    toolbox.register("evaluate", eval_routes, instance=instance_dict)
+    if evaluator == "delta":
+        toolbox.register("evaluate", eval_routes_delta, instance=instance_dict)
+    elif arrays is not None:
+        toolbox.register("evaluate", eval_routes_compiled, arrays=arrays)
+    else:
+        toolbox.register(
+            "evaluate",
+            eval_routes,
+            instance=instance_dict,
+            scalar=evaluator == "scalar",
+        )
+    caches = {}
+    if route_cache:
+        if evaluator != "matrix" or workers > 1:
+            raise ValueError(
+                "`route_cache` needs the `matrix` evaluator and a single worker."
+            )
+        caches["route_cache"] = LRUCache(route_cache)
+        toolbox.register(
+            "evaluate",
+            eval_routes_memo,
+            instance=instance_dict,
+            route_cache=caches["route_cache"],
+        )
+    # Evaluates a list of individuals, returning one fitness per individual
+    if evaluator == "batch":
+        toolbox.register("evaluate_population", eval_population, instance=instance_dict)
+    else:
+        toolbox.register(
+            "evaluate_population", lambda inds: list(map(toolbox.evaluate, inds))
+        )
     toolbox.register(
         "mate_1",
         part_one_edit(tools.cxPartialyMatched, len(instance_dict["stores"]) - 1),
@@ -77,15 +193,377 @@ def create_toolbox(instance_type, heterogeneous_vehicles, part2_type="greedy"):
         "mutate_dec", part_two_edit(dec_op, len(instance_dict["stores"]) - 1)
     )
 
-    toolbox.register("select", tools.selTournament, tournsize=20)
-    # toolbox.register("select", selInverseRoulette)
+    if selection == "tournament":
+        toolbox.register("select", selTournamentArray, tournsize=20)
+    elif selection == "deap-tournament":
+        toolbox.register("select", tools.selTournament, tournsize=20)
+    elif selection == "roulette":
+        toolbox.register("select", selInverseRoulette)
+    else:
+        toolbox.register("select", selInverseSUS)
+    toolbox.register(
+        "correct_routes", repair, len(instance_dict["stores"]) - 1, instance_dict
+    )
+    toolbox.register(
+        "correct_population",
+        correct_population,
+        len(instance_dict["stores"]) - 1,
+        instance_dict,
+        repair=repair,
+    )
+    if local_search == "off":
+        toolbox.register("local_search", lambda individuals: [])
+    else:
+        toolbox.register(
+            "local_search",
+            local_search_population,
+            len(instance_dict["stores"]) - 1,
+            instance_dict,
+            neighbours=neighbour_lists(instance_dict, neighbours),
+            mode=local_search,
+            rate=local_search_rate,
+        )
+    # Whole population matrices, used by the `matrix` engine
+    if arrays is not None:
+        toolbox.register("evaluate_genomes", eval_genomes_compiled, arrays=arrays)
+        toolbox.register(
+            "correct_genomes",
+            correct_genomes_compiled,
+            len(instance_dict["stores"]) - 1,
+            instance_dict,
+            arrays=arrays,
+        )
+    else:
+        toolbox.register("evaluate_genomes", eval_genomes, instance=instance_dict)
+        toolbox.register(
+            "correct_genomes",
+            correct_genomes,
+            len(instance_dict["stores"]) - 1,
+            instance_dict,
+        )
+    if engine == "matrix":
+        toolbox.register(
+            "next_generation",
+            next_generation_matrix,
+            toolbox,
+            store_count=len(instance_dict["stores"]) - 1,
+        )
+    else:
+        toolbox.register("next_generation", next_generation, toolbox)
+    toolbox.register("stats", population_stats)
+    toolbox.register("draw", draw_individual)
+    toolbox.register("shutdown", lambda: None)
+
+    if workers > 1 and shared_memory:
+        # Same pool, with the instance and the genomes in shared memory
+        pool = SharedPool(
+            instance_dict,
+            evaluator if arrays is None else "compiled",
+            workers,
+            start_method,
+            repair,
+        )
+        toolbox.register("evaluate_population", pool.evaluate_population)
+        toolbox.register("correct_population", pool.correct_population)
+        toolbox.register("evaluate_genomes", pool.evaluate_genomes)
+        toolbox.register("correct_genomes", pool.correct_genomes)
+        toolbox.register("shutdown", pool.shutdown)
+    elif workers > 1:
+        # Evaluation and route correction run on a process pool
+        pool = create_pool(
+            instance_dict,
+            evaluator if arrays is None else "compiled",
+            workers,
+            start_method,
+            repair,
+        )
+        toolbox.register("evaluate_population", pool_evaluate, pool, workers)
+        toolbox.register("correct_population", pool_correct, pool, workers)
+        toolbox.register("shutdown", pool.shutdown)
+
+    if fitness_cache:
+        # Duplicated genomes, e.g. clones of the elite, are not evaluated again
+        caches["fitness_cache"] = LRUCache(fitness_cache)
+        toolbox.register(
+            "evaluate_population",
+            memoize_population(toolbox.evaluate_population, caches["fitness_cache"]),
+        )
+    if screen_margin is not None:
+        # Offspring far from the best are scored by a lower bound of their cost.
+        # Wrapped around the fitness cache, so bounds are never cached.
+        caches["screening"] = Screening(instance_dict, screen_margin)
+        toolbox.register(
+            "evaluate_population",
+            caches["screening"].screen_population(toolbox.evaluate_population),
+        )
+        toolbox.register(
+            "evaluate_genomes",
+            caches["screening"].screen_genomes(toolbox.evaluate_genomes),
+        )
+        toolbox.register("stats", caches["screening"].screen_stats(toolbox.stats))
     toolbox.register(
-        "correct_routes", correct_route, len(instance_dict["stores"]) - 1, instance_dict
+        "cache_report",
+        lambda: "".join(cache.report(name) for name, cache in caches.items()),
+    )
+    # What must be checkpointed for a resumed run to go on as it would have
+    toolbox.register(
+        "checkpoint_states",
+        lambda: {name: obj for name, obj in caches.items() if hasattr(obj, "state")},
     )
 
     return toolbox, current_instance
 
 
+def evaluate_invalid(toolbox, individuals):
+    invalid_ind = [ind for ind in individuals if not ind.fitness.valid]
+    fitnesses = toolbox.evaluate_population(invalid_ind)
+    for ind, fit in zip(invalid_ind, fitnesses):
+        ind.fitness.values = fit
+
+
+def next_generation(
+    toolbox, pop, all_time_fittest, pop_size, cxpb1, mutpb1, mutpb2, keep_parents
+):
+    # cxpb1  is the probability with which part 1 of two individuals
+    #        are crossed
+    #
+    # MUTPB1 is the probability for mutating part 1 of an individual
+    # MUTPB2 is the probability for mutating part 2 of an individual
+
+    # Select the next generation individuals
+    pop = toolbox.select(pop, pop_size - 1)
+    # Add back the current fittest
+    pop.append(all_time_fittest)
+
+    # Clone the selected individuals
+    offspring = list(map(toolbox.clone, pop))
+
+    # # Apply crossover and mutation on the offspring
+    crossed = []
+    for child1, child2 in zip(offspring[::2], offspring[1::2]):
+        if random.random() < cxpb1:
+            toolbox.mate_1(child1, child2)
+            crossed.extend((child1, child2))
+            if hasattr(child1.fitness, "values"):
+                del child1.fitness.values
+            if hasattr(child2.fitness, "values"):
+                del child2.fitness.values
+    toolbox.correct_population(crossed)
+
+    mutants = []
+    for mutant in offspring:
+        mutated = False
+
+        if random.random() < mutpb1:
+            mutated = True
+            toolbox.mutate_swap(mutant)
+            if hasattr(mutant.fitness, "values"):
+                del mutant.fitness.values
+        # if random.random() < mutpb1:
+        #     mutated = True
+        #     toolbox.mutate_reverse(mutant)
+        #     if hasattr(mutant.fitness, "values"):
+        #         del mutant.fitness.values
+
+        if random.random() < mutpb2:
+            mutated = True
+            toolbox.mutate_inc(mutant)
+            if hasattr(mutant.fitness, "values"):
+                del mutant.fitness.values
+        if random.random() < mutpb2:
+            mutated = True
+            toolbox.mutate_dec(mutant)
+            if hasattr(mutant.fitness, "values"):
+                del mutant.fitness.values
+        # if random.random() < mutpb2:
+        #     mutated = True
+        #     toolbox.mutate_regen(mutant)
+        #     if hasattr(mutant.fitness, "values"):
+        #         del mutant.fitness.values
+        if mutated:
+            mutants.append(mutant)
+    toolbox.correct_population(mutants)
+
+    # Evaluate the individuals with an invalid fitness
+    fresh = [ind for ind in offspring if not ind.fitness.valid]
+    evaluate_invalid(toolbox, offspring)
+    # Memetic step over some of the new individuals, nothing when it is off
+    evaluate_invalid(toolbox, toolbox.local_search(fresh))
+
+    return offspring + pop if keep_parents else offspring
+
+
+def population_stats(pop):
+    fits = [ind.fitness.values[0] for ind in pop]
+
+    length = len(pop)
+    mean = sum(fits) / length
+    sum2 = sum(x * x for x in fits)
+    std = abs(sum2 / length - mean**2) ** 0.5
+    return fits, mean, std
+
+
+def create_instrumentation(toolbox, options, analysis_folder):
+    # Opt-in, nothing is wrapped or profiled otherwise
+    phase_log = generation_profiler = None
+    if options["instrument"]:
+        timings = time_operators(toolbox)
+        phase_log = PhaseLog(analysis_folder / "timings.csv", timings)
+    if options["profile_window"]:
+        generation_profiler = GenerationProfiler(
+            options["profile_window"], analysis_folder, options["profiler"]
+        )
+    return phase_log, generation_profiler
+
+
+def create_stopping_rule(options):
+    return StoppingRule(
+        stall=options["stall_generations"],
+        epsilon=options["epsilon"],
+        window=options["epsilon_window"],
+        time_budget=options["time_budget"],
+        target=options["target_cost"],
+    )
+
+
+def evolve(
+    toolbox,
+    pop,
+    all_time_fittest,
+    options,
+    fitness_log,
+    stopping_rule,
+    start,
+    first_g=0,
+    progress=None,
+    migrate=None,
+    after_generation=None,
+    generation_profiler=None,
+    phase_log=None,
+):
+    """
+    Generation loop of `mtsp`, its islands and the sweeps, from `first_g` up to
+    the `rounds` in `options` or until `stopping_rule` stops it. `migrate(g,
+    pop)` returns the population right after it is bred, and
+    `after_generation(g, pop, all_time_fittest, stop_reason)` runs once it is
+    logged and may return its own reason to stop.
+
+    Returns `(pop, all_time_fittest, g, stop_reason)`, `g` being the last
+    generation done.
+    """
+    generations = range(first_g, options["rounds"])
+    if progress:
+        generations = progress(generations)
+    mutpb1, mutpb2 = options["mutpb1"], options["mutpb2"]
+    rates = mutpb1, mutpb2
+    if options["adaptive_mutation"]:
+        _, mean, std = toolbox.stats(pop)
+        rates = adaptive_rates(
+            mutpb1, mutpb2, mean, std, options["diversity_threshold"]
+        )
+
+    stop_reason = None
+    g = first_g - 1
+    for g in generations:
+        if generation_profiler:
+            generation_profiler.step(g)
+        pop = toolbox.next_generation(
+            pop,
+            all_time_fittest,
+            options["pop_size"],
+            options["cxpb1"],
+            *rates,
+            options["keep_parents"],
+        )
+        if migrate:
+            pop = migrate(g, pop)
+
+        # Gather all the fitnesses in one list and print the stats
+        fits, mean, std = toolbox.stats(pop)
+        # Find if we have a new fittest, screened offspring have a nan fitness
+        fraser = pop[np.nanargmin(fits)]
+        if fraser.fitness.values[0] < all_time_fittest.fitness.values[0]:
+            all_time_fittest = fraser
+        fitness_log.append(g, np.nanmin(fits), np.nanmax(fits), mean, std, fraser)
+
+        if options["adaptive_mutation"]:
+            # More mutation as the population loses its diversity
+            rates = adaptive_rates(
+                mutpb1, mutpb2, mean, std, options["diversity_threshold"]
+            )
+        stop_reason = stopping_rule.update(
+            all_time_fittest.fitness.values[0], time.time() - start
+        )
+        if after_generation:
+            stop_reason = (
+                after_generation(g, pop, all_time_fittest, stop_reason) or stop_reason
+            )
+        if phase_log:
+            phase_log.write(g)
+        if stop_reason:
+            break
+    return pop, all_time_fittest, g, stop_reason
+
+
+def write_result(path, ind, store_count, vehicles=None):
+    with open(path, "w+") as f_result:
+        routes, route_idxs = as_list(ind[:store_count]), as_list(ind[store_count:])
+        route_start_idx = 0
+        vehicle_types = []
+        for v_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
+            route = routes[route_start_idx:route_finish_idx]
+            f_result.write("0 ")
+            f_result.write(" ".join(str(idx) for idx in route))
+            f_result.write(" 0 ")
+            route_start_idx = route_finish_idx
+            vehicle_types.append(vehicles[v_idx]["type"]) if vehicles else None
+        f_result.write("\n" + " ".join(vehicle_types) + "\n")
+        f_result.write(str(ind.fitness.values[0]))
+        f_result.write("\n")
+
+
+def create_output_folder(run_name, instance, saved_args):
+    if run_name is None:
+        run_name = f"{instance.config}_{datetime.now().strftime('%m_%d_%H%M%S')}"
+    output_folder = Path("results") / run_name
+    output_folder.mkdir()
+    (output_folder / "analysis").mkdir()
+    with open(output_folder / "analysis" / "config.txt", "w+") as f_config:
+        for arg in saved_args:
+            f_config.write(f"{arg}={saved_args[arg]}\n")
+    return output_folder
+
+
+def main_islands(saved_args):
+    # Imported here since the island processes import this module
+    from scripts.islands import run_islands
+
+    instance = get_instancer(saved_args["ins"], heterogeneous_vehicles=saved_args["h"])
+    output_folder = create_output_folder(saved_args["run_name"], instance, saved_args)
+    options = dict(saved_args, output_folder=str(output_folder))
+    best, elapsed, time_to_target, stop_reason, generations = run_islands(
+        options,
+        instance,
+        saved_args["islands"],
+        saved_args["topology"],
+        saved_args["start_method"],
+    )
+    with open(output_folder / "analysis" / "config.txt", "a") as f_config:
+        f_config.write(f"elapsed={elapsed:.2f}s\n")
+        if time_to_target is not None:
+            f_config.write(f"time_to_target={time_to_target:.2f}s\n")
+        f_config.write(f"stop_reason={stop_reason}\n")
+        f_config.write(f"generations={generations}\n")
+    if not saved_args["headless"]:
+        draw_individual(
+            best,
+            instance.get_store_positions(),
+            saved_args["rounds"] - 1,
+            output_folder.name,
+            save_fig=saved_args["save_fig"],
+        )
+
+
 @click.command()
 @click.option("--ins", default="rc101")
 @click.option("--h/--no-h", default=False)
@@ -101,8 +579,97 @@ def create_toolbox(instance_type, heterogeneous_vehicles, part2_type="greedy"):
 @click.option("--mutpb2", default=0.2, type=float)
 @click.option("--rounds", default=1000, type=int)
 @click.option("--keep-parents", is_flag=True)
+@click.option("--stall-generations", default=None, type=int)
+@click.option("--epsilon", default=None, type=float)
+@click.option("--epsilon-window", default=100, type=int)
+@click.option("--time-budget", default=None, type=float, help="Seconds.")
+@click.option("--target-cost", default=None, type=float)
+@click.option("--adaptive-mutation", is_flag=True)
+@click.option("--diversity-threshold", default=0.01, type=float)
 @click.option("--pop-size", default=100, type=int)
 @click.option("--run-name", default=None, type=str)
+@click.option(
+    "--checkpoint-interval",
+    default=100,
+    type=int,
+    help="Generations. Runs with `--islands` do not checkpoint.",
+)
+@click.option("--resume", is_flag=True)
+@click.option(
+    "--evaluator",
+    default="matrix",
+    type=click.Choice(["matrix", "scalar", "batch", "delta"]),
+)
+@click.option(
+    "--genome",
+    default="list",
+    type=click.Choice(["list", "array"]),
+)
+@click.option(
+    "--decoder",
+    default="repair",
+    type=click.Choice(["repair", "split"]),
+)
+@click.option("--split-lookahead", default=None, type=int)
+@click.option(
+    "--draw-mode",
+    default="async",
+    type=click.Choice(["async", "sync"]),
+)
+@click.option(
+    "--selection",
+    default="tournament",
+    type=click.Choice(["tournament", "deap-tournament", "roulette", "sus"]),
+)
+@click.option(
+    "--local-search",
+    default="off",
+    type=click.Choice(["off", "elite", "offspring"]),
+)
+@click.option("--local-search-rate", default=0.1, type=float)
+@click.option("--neighbours", default=10, type=int)
+@click.option(
+    "--backend",
+    default="python",
+    type=click.Choice(["python", "numba"]),
+)
+@click.option(
+    "--engine",
+    default="deap",
+    type=click.Choice(["deap", "matrix"]),
+)
+@click.option("--screen-margin", default=None, type=float)
+@click.option("--fitness-cache", default=0, type=int)
+@click.option("--route-cache", default=0, type=int)
+@click.option("--headless", is_flag=True)
+@click.option("--flush-interval", default=100, type=int)
+@click.option(
+    "--columnar",
+    default=None,
+    type=click.Choice(["npz", "parquet"]),
+)
+@click.option("--instrument", is_flag=True)
+@click.option("--profile-window", default=None, type=str)
+@click.option(
+    "--profiler",
+    default="cprofile",
+    type=click.Choice(["cprofile", "pyinstrument"]),
+)
+@click.option("--workers", default=1, type=int)
+@click.option("--shared-memory", is_flag=True)
+@click.option("--islands", default=1, type=int)
+@click.option(
+    "--topology",
+    default="ring",
+    type=click.Choice(["ring", "full"]),
+)
+@click.option("--migration-interval", default=50, type=int)
+@click.option("--migrants", default=2, type=int)
+@click.option(
+    "--start-method",
+    default=None,
+    type=click.Choice(["fork", "spawn", "forkserver"]),
+)
 def main(
     ins,
     h,
@@ -114,150 +681,196 @@ def main(
     mutpb2,
     rounds,
     keep_parents,
+    stall_generations,
+    epsilon,
+    epsilon_window,
+    time_budget,
+    target_cost,
+    adaptive_mutation,
+    diversity_threshold,
     pop_size,
     run_name,
+    checkpoint_interval,
+    resume,
+    evaluator,
+    genome,
+    decoder,
+    split_lookahead,
+    draw_mode,
+    headless,
+    selection,
+    local_search,
+    local_search_rate,
+    neighbours,
+    backend,
+    engine,
+    screen_margin,
+    fitness_cache,
+    route_cache,
+    flush_interval,
+    columnar,
+    instrument,
+    profile_window,
+    profiler,
+    workers,
+    shared_memory,
+    islands,
+    topology,
+    migration_interval,
+    migrants,
+    start_method,
 ):
     saved_args = locals()
+    if resume and (run_name is None or islands > 1):
+        raise ValueError(
+            "`--resume` needs the `--run-name` of a single population run."
+        )
+    check_columnar(columnar)
+    if islands > 1:
+        return main_islands(saved_args)
+
+    instance = get_instancer(ins, heterogeneous_vehicles=h)
+    first_g, vehicles, elapsed = 0, None, 0
+    stopping_rule = create_stopping_rule(saved_args)
+    if resume:
+        # Restores the population and the random states as they were after `g`
+        create_types()
+        output_folder = Path("results") / run_name
+        g, pop, all_time_fittest, vehicles, elapsed, saved_states = load_checkpoint(
+            output_folder,
+            instance.config,
+            ArrayIndividual if genome == "array" else creator.Individual,
+        )
+        first_g = g + 1
+        with open(output_folder / "analysis" / "config.txt", "a") as f_config:
+            f_config.write(f"resumed_from={first_g}\n")
+    instance_dict = instance.get_instance_dict(vehicles)
+
     toolbox, instance = create_toolbox(
-        ins, heterogeneous_vehicles=h, part2_type=part2_type
+        ins,
+        heterogeneous_vehicles=h,
+        part2_type=part2_type,
+        evaluator=evaluator,
+        workers=workers,
+        start_method=start_method,
+        instance_dict=instance_dict,
+        genome=genome,
+        decoder=decoder,
+        split_lookahead=split_lookahead,
+        fitness_cache=fitness_cache,
+        route_cache=route_cache,
+        selection=selection,
+        local_search=local_search,
+        local_search_rate=local_search_rate,
+        neighbours=neighbours,
+        backend=backend,
+        engine=engine,
+        screen_margin=screen_margin,
+        shared_memory=shared_memory,
+        instancer=instance,
     )
+    states = dict(toolbox.checkpoint_states(), stopping=stopping_rule)
+    if resume:
+        for name, obj in states.items():
+            # Checkpoints from older versions may lack some of them
+            if name in saved_states:
+                obj.restore(saved_states[name])
     stores = instance.get_store_positions()
-    start = time.time()
-    pop = toolbox.population(n=pop_size)
-
-    # Evaluate the entire population
-    fitnesses = list(map(toolbox.evaluate, pop))
-    for ind, fit in zip(pop, fitnesses):
-        ind.fitness.values = fit
-
-    # cxpb1  is the probability with which part 1 of two individuals
-    #        are crossed
-    #
-    # MUTPB1 is the probability for mutating part 1 of an individual
-    # MUTPB2 is the probability for mutating part 2 of an individual
-    output = []
-    if run_name is None:
-        run_name = f"{instance.config}_{datetime.now().strftime('%m_%d_%H%M%S')}"
-    output_folder = Path("results") / run_name
-    output_folder.mkdir()
-    (output_folder / "analysis").mkdir()
-    with open(output_folder / "analysis" / "config.txt", "w+") as f_config:
-        for arg in saved_args:
-            f_config.write(f"{arg}={saved_args[arg]}\n")
+    start = time.time() - elapsed
+    if not resume:
+        pop = toolbox.population(n=pop_size)
 
-    # Extracting all the fitnesses of
-    fits = [ind.fitness.values[0] for ind in pop]
-    all_time_fittest = pop[np.argmin(fits)]
+        # Evaluate the entire population
+        evaluate_invalid(toolbox, pop)
 
-    # Begin the evolution
-    for g in tqdm(range(rounds)):
-        # Select the next generation individuals
-        pop = toolbox.select(pop, pop_size - 1)
-        # Add back the current fittest
-        pop.append(all_time_fittest)
-
-        # Clone the selected individuals
-        offspring = list(map(toolbox.clone, pop))
-
-        # # Apply crossover and mutation on the offspring
-        for child1, child2 in zip(offspring[::2], offspring[1::2]):
-            if random.random() < cxpb1:
-                toolbox.mate_1(child1, child2)
-                toolbox.correct_routes(child1)
-                toolbox.correct_routes(child2)
-                if hasattr(child1.fitness, "values"):
-                    del child1.fitness.values
-                if hasattr(child2.fitness, "values"):
-                    del child2.fitness.values
-
-        for mutant in offspring:
-            mutated = False
-
-            if random.random() < mutpb1:
-                mutated = True
-                toolbox.mutate_swap(mutant)
-                if hasattr(mutant.fitness, "values"):
-                    del mutant.fitness.values
-            # if random.random() < mutpb1:
-            #     mutated = True
-            #     toolbox.mutate_reverse(mutant)
-            #     if hasattr(mutant.fitness, "values"):
-            #         del mutant.fitness.values
-
-            if random.random() < mutpb2:
-                mutated = True
-                toolbox.mutate_inc(mutant)
-                if hasattr(mutant.fitness, "values"):
-                    del mutant.fitness.values
-            if random.random() < mutpb2:
-                mutated = True
-                toolbox.mutate_dec(mutant)
-                if hasattr(mutant.fitness, "values"):
-                    del mutant.fitness.values
-            # if random.random() < mutpb2:
-            #     mutated = True
-            #     toolbox.mutate_regen(mutant)
-            #     if hasattr(mutant.fitness, "values"):
-            #         del mutant.fitness.values
-            if mutated:
-                toolbox.correct_routes(mutant)
-
-        # Evaluate the individuals with an invalid fitness
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = map(toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
-
-        pop[:] = offspring + pop if keep_parents else offspring
+        output_folder = create_output_folder(run_name, instance, saved_args)
 
-        # Gather all the fitnesses in one list and print the stats
+        # Extracting all the fitnesses of
         fits = [ind.fitness.values[0] for ind in pop]
+        all_time_fittest = pop[np.argmin(fits)]
+    run_name = output_folder.name
+    fitness_log = FitnessLog(
+        output_folder / "analysis",
+        flush_interval=flush_interval,
+        columnar=columnar,
+        start=first_g,
+    )
 
-        length = len(pop)
-        mean = sum(fits) / length
-        sum2 = sum(x * x for x in fits)
-        std = abs(sum2 / length - mean ** 2) ** 0.5
-        # Find if we have a new fittest
-        fraser = pop[np.argmin(fits)]
-        if fraser.fitness.values[0] < all_time_fittest.fitness.values[0]:
-            all_time_fittest = fraser
+    drawer = progress = None
+    if headless:
+        # Neither matplotlib nor tqdm are ever imported
+        toolbox.register("draw", lambda *args, **kwargs: None)
+    else:
+        from tqdm import tqdm
 
-        output.append(
-            f'{g},{min(fits):.5f},{max(fits):.5f},{mean:.5f},{std:.5f},"{fraser}"\n'
-        )
+        progress = partial(tqdm, initial=first_g, total=rounds)
+        if draw_mode == "async":
+            drawer = BackgroundDrawer()
+            toolbox.register("draw", drawer)
+
+    phase_log, generation_profiler = create_instrumentation(
+        toolbox, saved_args, output_folder / "analysis"
+    )
 
+    def after_generation(g, pop, all_time_fittest, stop_reason):
         # Plot the fittest every 100 generations
         if (g + 1) % fig_interval == 0 or g == 0:
-            draw_individual(all_time_fittest, stores, g, run_name, save_fig=save_fig)
+            toolbox.draw(all_time_fittest, stores, g, run_name, save_fig=save_fig)
+
+        if checkpoint_interval and (
+            (g + 1) % checkpoint_interval == 0 or g == rounds - 1 or stop_reason
+        ):
+            # The log must not fall behind the checkpoint it is resumed from
+            fitness_log.flush()
+            save_checkpoint(
+                output_folder,
+                g,
+                pop,
+                all_time_fittest,
+                instance_dict["vehicles"],
+                instance.config,
+                time.time() - start,
+                states=states,
+            )
 
+    # Begin the evolution
+    pop, all_time_fittest, g, stop_reason = evolve(
+        toolbox,
+        pop,
+        all_time_fittest,
+        saved_args,
+        fitness_log,
+        stopping_rule,
+        start,
+        first_g=first_g,
+        progress=progress,
+        after_generation=after_generation,
+        generation_profiler=generation_profiler,
+        phase_log=phase_log,
+    )
+
+    fitness_log.close()
+    if phase_log:
+        phase_log.close()
+    if generation_profiler:
+        generation_profiler.stop()
+    if drawer:
+        drawer.close()
+    toolbox.shutdown()
     elapsed = time.time() - start
     elapsed = f"elapsed={elapsed:.2f}s\n"
     with open(output_folder / "analysis" / "config.txt", "a") as f_config:
         f_config.write(elapsed)
-    with open(output_folder / "analysis" / "fitness.csv", "w+") as f_fitnesses:
-        f_fitnesses.write("g,min,max,mean,std,ind\n")
-        f_fitnesses.writelines(output)
+        f_config.write(f"stop_reason={stop_reason or 'rounds'}\n")
+        f_config.write(f"generations={g + 1}\n")
+        f_config.write(toolbox.cache_report())
     # Print output
-    with open(output_folder / "result.txt", "w+") as f_result:
-        store_count = len(stores) - 1
-        routes, route_idxs = (
-            all_time_fittest[:store_count],
-            all_time_fittest[store_count:],
-        )
-        route_start_idx = 0
-        vehicle_types = []
-        for v_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
-            route = routes[route_start_idx:route_finish_idx]
-            f_result.write("0 ")
-            f_result.write(" ".join(str(idx) for idx in route))
-            f_result.write(" 0 ")
-            route_start_idx = route_finish_idx
-            vehicle_types.append(
-                instance.get_instance_dict()["vehicles"][v_idx]["type"]
-            ) if h else None
-        f_result.write("\n" + " ".join(vehicle_types) + "\n")
-        f_result.write(str(all_time_fittest.fitness.values[0]))
-        f_result.write("\n")
+    write_result(
+        output_folder / "result.txt",
+        all_time_fittest,
+        len(stores) - 1,
+        instance_dict["vehicles"] if h else None,
+    )
 
 
 if __name__ == "__main__":
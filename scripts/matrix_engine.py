@@ -0,0 +1,150 @@
+import numpy as np
+from deap import creator
+
+from scripts.genome import ArrayIndividual
+
+#
+# Population matrix engine. A generation works on one `(pop_size, genome_len)`
+# integer array: crossover, mutation, repair and evaluation are applied to all
+# the selected rows at once, so their cost does not grow with interpreter
+# overhead per individual. Only the selection and the returned individuals,
+# row views of the matrix, are handled one by one.
+#
+# Same operators and probabilities as `next_generation`, drawn with
+# `numpy.random` instead of `random`.
+#
+
+
+def population_matrix(individuals):
+    # Array individuals are copied row by row without going through lists
+    return np.array(individuals, dtype=np.int32)
+
+
+def matrix_population(genomes, fitnesses):
+    # Individuals sharing the rows of `genomes`, with their fitness already set
+    population = []
+    for genome, fitness in zip(genomes, fitnesses.tolist()):
+        ind = genome.view(ArrayIndividual)
+        ind.fitness = creator.FitnessMin((fitness,))
+        population.append(ind)
+    return population
+
+
+def cx_pmx_rows(parents1, parents2):
+    """
+    :func:`deap.tools.cxPartialyMatched` between every row of `parents1` and
+    the same row of `parents2`, in place. The loop walks the gene positions,
+    each step swaps the genes of all the pairs whose section includes it.
+    """
+    pairs, size = parents1.shape
+    rows = np.arange(pairs)[:, np.newaxis]
+    genes = np.broadcast_to(np.arange(size), (pairs, size))
+    # Position of every gene in each parent
+    positions1 = np.empty_like(parents1)
+    positions2 = np.empty_like(parents2)
+    positions1[rows, parents1] = genes
+    positions2[rows, parents2] = genes
+
+    cxpoint1 = np.random.randint(0, size + 1, pairs)
+    cxpoint2 = np.random.randint(0, size, pairs)
+    ordered = cxpoint2 >= cxpoint1
+    low = np.where(ordered, cxpoint1, cxpoint2)
+    high = np.where(ordered, cxpoint2 + 1, cxpoint1)
+
+    for i in range(low.min(initial=size), high.max(initial=0)):
+        active = np.flatnonzero((low <= i) & (i < high))
+        gene1, gene2 = parents1[active, i], parents2[active, i]
+        swap1, swap2 = positions1[active, gene2], positions2[active, gene1]
+        parents1[active, i] = gene2
+        parents1[active, swap1] = gene1
+        parents2[active, i] = gene1
+        parents2[active, swap2] = gene2
+        for positions in (positions1, positions2):
+            moved1, moved2 = positions[active, gene1], positions[active, gene2]
+            positions[active, gene1], positions[active, gene2] = moved2, moved1
+    return parents1, parents2
+
+
+def mutate_swap_rows(genomes, rows):
+    # `swap_op` on part 1 of every row in `rows`
+    size = genomes.shape[1]
+    idx1 = np.random.randint(0, size, len(rows))
+    idx2 = np.random.randint(0, size, len(rows))
+    genes1 = genomes[rows, idx1]
+    genomes[rows, idx1] = genomes[rows, idx2]
+    genomes[rows, idx2] = genes1
+    return genomes
+
+
+def mutate_inc_rows(route_idxs, rows, max_value):
+    # `inc_op` on part 2 of every row in `rows`
+    size = route_idxs.shape[1]
+    idx = np.random.randint(0, size, len(rows))
+    values = route_idxs[rows, idx]
+    following = route_idxs[rows, np.minimum(idx + 1, size - 1)]
+    valid = (values + 1 <= max_value) & ((idx == size - 1) | (values < following))
+    route_idxs[rows[valid], idx[valid]] += 1
+    return route_idxs
+
+
+def mutate_dec_rows(route_idxs, rows):
+    # `dec_op` on part 2 of every row in `rows`
+    size = route_idxs.shape[1]
+    idx = np.random.randint(0, size, len(rows))
+    values = route_idxs[rows, idx]
+    previous = route_idxs[rows, np.maximum(idx - 1, 0)]
+    valid = (values - 1 >= 0) & ((idx == 0) | (previous <= values))
+    route_idxs[rows[valid], idx[valid]] -= 1
+    return route_idxs
+
+
+def next_generation_matrix(
+    toolbox,
+    pop,
+    all_time_fittest,
+    pop_size,
+    cxpb1,
+    mutpb1,
+    mutpb2,
+    keep_parents,
+    store_count=None,
+):
+    # Drop-in replacement of `next_generation`
+    pop = toolbox.select(pop, pop_size - 1)
+    pop.append(all_time_fittest)
+
+    genomes = population_matrix(pop)
+    fitnesses = np.array([ind.fitness.values[0] for ind in pop])
+    routes, route_idxs = genomes[:, :store_count], genomes[:, store_count:]
+
+    # Pairs (0, 1), (2, 3), ... are crossed with probability `cxpb1`
+    pairs = np.flatnonzero(np.random.random(len(genomes) // 2) < cxpb1) * 2
+    parents1, parents2 = cx_pmx_rows(routes[pairs], routes[pairs + 1])
+    routes[pairs], routes[pairs + 1] = parents1, parents2
+    crossed = np.concatenate([pairs, pairs + 1])
+    genomes[crossed] = toolbox.correct_genomes(genomes[crossed])
+
+    swapped = np.flatnonzero(np.random.random(len(genomes)) < mutpb1)
+    mutate_swap_rows(routes, swapped)
+    mutated = [swapped]
+    if route_idxs.shape[1]:
+        increased = np.flatnonzero(np.random.random(len(genomes)) < mutpb2)
+        mutate_inc_rows(route_idxs, increased, store_count)
+        decreased = np.flatnonzero(np.random.random(len(genomes)) < mutpb2)
+        mutate_dec_rows(route_idxs, decreased)
+        mutated.extend((increased, decreased))
+    mutants = np.unique(np.concatenate(mutated))
+    genomes[mutants] = toolbox.correct_genomes(genomes[mutants])
+
+    invalid = np.union1d(crossed, mutants)
+    if len(invalid):
+        fitnesses[invalid] = toolbox.evaluate_genomes(genomes[invalid])
+    offspring = matrix_population(genomes, fitnesses)
+
+    # Memetic step over some of the new individuals, nothing when it is off
+    fresh = [offspring[idx] for idx in invalid.tolist()]
+    changed = toolbox.local_search(fresh)
+    for ind, fit in zip(changed, toolbox.evaluate_population(changed)):
+        ind.fitness.values = fit
+
+    return offspring + pop if keep_parents else offspring
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from scripts.utils import as_list, eval_route_matrix
+
+
+class LRUCache:
+    """
+    Dict bounded to the `maxsize` most recently used keys, counting hits and
+    misses.
+    """
+
+    def __init__(self, maxsize):
+        if maxsize < 1:
+            raise ValueError("`maxsize` must be at least 1.")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self, name):
+        return (
+            f"{name}_hits={self.hits}\n"
+            f"{name}_misses={self.misses}\n"
+            f"{name}_hit_rate={self.hit_rate:.4f}\n"
+        )
+
+
+def genome_key(ind):
+    # The genome itself, so different genomes never share a fitness
+    if isinstance(ind, np.ndarray):
+        return ind.tobytes()
+    return tuple(ind)
+
+
+def memoize_population(evaluate_population, cache):
+    """
+    Wraps an `evaluate_population` so only the genomes missing in `cache` are
+    evaluated, each of them once even if repeated in `individuals`.
+    """
+
+    def cached_evaluate_population(individuals):
+        keys = [genome_key(ind) for ind in individuals]
+        fitnesses = [cache.get(key) for key in keys]
+        missing = {}
+        for idx, (key, fit) in enumerate(zip(keys, fitnesses)):
+            if fit is None:
+                missing.setdefault(key, []).append(idx)
+        if missing:
+            first_idxs = [idxs[0] for idxs in missing.values()]
+            new_fitnesses = evaluate_population([individuals[i] for i in first_idxs])
+            for (key, idxs), fit in zip(missing.items(), new_fitnesses):
+                fit = tuple(fit)
+                cache.put(key, fit)
+                for idx in idxs:
+                    fitnesses[idx] = fit
+        return fitnesses
+
+    return cached_evaluate_population
+
+
+def eval_routes_memo(individual, instance=None, route_cache=None):
+    """
+    `eval_routes` where the cost of every route is looked up in `route_cache`
+    first. Routes only depend on the rate of their vehicle, so identical routes
+    of different individuals are costed once.
+    """
+    if not instance:
+        raise ValueError("`instance` cannot be None.")
+
+    store_count = len(instance["stores"]) - 1
+    rates = instance["lookup"]["rates"]
+    individual = as_list(individual)
+    routes, route_idxs = individual[:store_count], individual[store_count:]
+
+    cost = 0
+    route_start_idx = 0
+    for v_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
+        route = routes[route_start_idx:route_finish_idx]
+        key = (rates[v_idx], tuple(route))
+        route_cost = route_cache.get(key)
+        if route_cost is None:
+            route_cost = eval_route_matrix(route, v_idx, instance)
+            route_cache.put(key, route_cost)
+        cost += route_cost
+        route_start_idx = route_finish_idx
+
+    return (cost,)
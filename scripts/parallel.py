@@ -0,0 +1,107 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.utils import (
+    as_list,
+    correct_genomes,
+    correct_route,
+    create_types,
+    eval_genomes,
+    eval_routes,
+)
+
+#
+# Worker side. The instance is shipped once through the pool initializer and
+# kept in module globals, so tasks only carry plain genome lists.
+#
+
+_instance = None
+_evaluator = None
+_repair = None
+_arrays = None
+
+
+def init_worker(instance, evaluator, repair):
+    global _instance, _evaluator, _repair, _arrays
+    # Spawned workers start with an empty `deap.creator`
+    create_types()
+    _instance = instance
+    _evaluator = evaluator
+    _repair = repair
+    if evaluator == "compiled":
+        from scripts.kernels import instance_arrays
+
+        _arrays = instance_arrays(instance)
+
+
+def evaluate_chunk(genomes):
+    if _evaluator == "compiled":
+        from scripts.kernels import eval_routes_compiled
+
+        return [eval_routes_compiled(genome, arrays=_arrays) for genome in genomes]
+    if _evaluator == "batch":
+        return [(cost,) for cost in eval_genomes(genomes, _instance).tolist()]
+    scalar = _evaluator == "scalar"
+    return [eval_routes(genome, _instance, scalar=scalar) for genome in genomes]
+
+
+def correct_chunk(genomes):
+    store_count = len(_instance["stores"]) - 1
+    return [_repair(store_count, _instance, genome) for genome in genomes]
+
+
+# Same as the `evaluate_genomes` and `correct_genomes` of the toolbox, for
+# 2-D integer arrays
+
+
+def evaluate_genomes_chunk(genomes):
+    if _evaluator == "compiled":
+        from scripts.kernels import eval_genomes_compiled
+
+        return eval_genomes_compiled(genomes, arrays=_arrays)
+    return eval_genomes(genomes, _instance)
+
+
+def correct_genomes_chunk(genomes):
+    store_count = len(_instance["stores"]) - 1
+    if _evaluator == "compiled":
+        from scripts.kernels import correct_genomes_compiled
+
+        return correct_genomes_compiled(store_count, _instance, genomes, _arrays)
+    return correct_genomes(store_count, _instance, genomes)
+
+
+#
+# Main process side
+#
+
+
+def create_pool(instance, evaluator, workers, start_method=None, repair=correct_route):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_worker,
+        initargs=(instance, evaluator, repair),
+    )
+
+
+def split_chunks(items, chunk_count):
+    # One task per chunk keeps the IPC round trips to a few per call.
+    size = max(1, math.ceil(len(items) / chunk_count))
+    return [items[idx : idx + size] for idx in range(0, len(items), size)]
+
+
+def pool_evaluate(pool, workers, individuals):
+    chunks = split_chunks([as_list(ind) for ind in individuals], workers)
+    return [fit for chunk in pool.map(evaluate_chunk, chunks) for fit in chunk]
+
+
+def pool_correct(pool, workers, individuals):
+    chunks = split_chunks([as_list(ind) for ind in individuals], workers)
+    corrected = (
+        genome for chunk in pool.map(correct_chunk, chunks) for genome in chunk
+    )
+    for ind, genome in zip(individuals, corrected):
+        ind[:] = genome
+    return individuals
@@ -0,0 +1,58 @@
+import multiprocessing
+import queue
+
+from deap import creator
+
+from scripts.utils import as_list, create_types, draw_individual
+
+#
+# Background rendering of the fittest individual, so the generation loop never
+# waits on matplotlib.
+#
+
+
+def render_snapshots(snapshots):
+    create_types()
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        genome, values, stores, gen, run_name, save_fig = snapshot
+        ind = creator.Individual(genome)
+        ind.fitness.values = values
+        draw_individual(ind, stores, gen, run_name, save_fig=save_fig)
+
+
+class BackgroundDrawer:
+    """
+    Drop-in replacement of `draw_individual` that hands snapshots to a
+    rendering process. The queue holds a single pending snapshot, a newer one
+    replaces it, so frames that could not be drawn in time are dropped.
+    """
+
+    def __init__(self):
+        self.snapshots = multiprocessing.Queue(maxsize=1)
+        self.process = multiprocessing.Process(
+            target=render_snapshots, args=(self.snapshots,), daemon=True
+        )
+        self.process.start()
+
+    def __call__(self, ind, stores, gen, run_name, save_fig=False):
+        snapshot = (as_list(ind), ind.fitness.values, stores, gen, run_name, save_fig)
+        try:
+            self.snapshots.put_nowait(snapshot)
+        except queue.Full:
+            # Replace the stale frame, never block
+            try:
+                self.snapshots.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.snapshots.put_nowait(snapshot)
+            except queue.Full:
+                pass
+
+    def close(self):
+        # Lets the last snapshot be drawn before the run finishes
+        self.snapshots.put(None)
+        self.process.join()
@@ -0,0 +1,273 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instances.parser import build_lookup
+from scripts.parallel import (
+    correct_chunk,
+    correct_genomes_chunk,
+    evaluate_chunk,
+    evaluate_genomes_chunk,
+    init_worker,
+)
+from scripts.utils import correct_route
+
+#
+# Shared memory pool. The instance arrays are published once in a shared
+# block, and the genomes and fitnesses of the individuals to evaluate or
+# repair live in a second one. Workers attach to both by name and read and
+# write their rows in place, so a task only carries the block name and a
+# range of rows instead of pickled genomes.
+#
+
+INSTANCE_ARRAYS = [
+    "distances",
+    "ready_times",
+    "due_dates",
+    "service_times",
+    "demands",
+    "positions",
+    "capacities",
+    "rates",
+]
+# Every array starts on its own cache line
+ALIGNMENT = 64
+
+
+class SharedArrays:
+    """
+    Named numpy arrays laid out in one `SharedMemory` block. `spec` is all
+    another process needs to attach to them with `SharedArrays.attach`.
+    """
+
+    def __init__(self, shm, layout):
+        self.shm = shm
+        self.spec = (shm.name, layout)
+        self.arrays = {
+            key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for key, shape, dtype, offset in layout
+        }
+
+    @classmethod
+    def create(cls, shapes):
+        # `shapes` maps every name to its `(shape, dtype)`, arrays start zeroed
+        layout, size = [], 0
+        for key, (shape, dtype) in shapes.items():
+            layout.append((key, tuple(shape), np.dtype(dtype).str, size))
+            nbytes = math.prod(shape) * np.dtype(dtype).itemsize
+            size += -(-nbytes // ALIGNMENT) * ALIGNMENT
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        return cls(shm, layout)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        shared = cls.create(
+            {key: (array.shape, array.dtype) for key, array in arrays.items()}
+        )
+        for key, array in arrays.items():
+            shared.arrays[key][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, layout = spec
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self):
+        # Views must go before the block can be unmapped
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def instance_from_arrays(arrays, vehicles):
+    """
+    Instance dict as `Instancer.get_instance_dict` builds it, from the
+    instance arrays and the vehicles in their order.
+    """
+    instance = dict(arrays, vehicles=vehicles)
+    if "distances" not in instance:
+        # Generated instances too large for a matrix compute them when needed
+        from instances.generator import PointDistances
+
+        instance["distances"] = PointDistances(instance["positions"])
+    instance["stores"] = [
+        {
+            "position": tuple(position),
+            "demand": demand,
+            "window": (ready_time, due_date),
+            "service_time": service_time,
+        }
+        for position, demand, ready_time, due_date, service_time in zip(
+            instance["positions"].tolist(),
+            instance["demands"].tolist(),
+            instance["ready_times"].tolist(),
+            instance["due_dates"].tolist(),
+            instance["service_times"].tolist(),
+        )
+    ]
+    instance["lookup"] = build_lookup(instance)
+    return instance
+
+
+#
+# Worker side, on top of the `scripts.parallel` workers
+#
+
+_instance_arrays = None
+_population = None
+
+
+def init_shared_worker(instance_spec, vehicles, evaluator, repair):
+    global _instance_arrays
+    _instance_arrays = SharedArrays.attach(instance_spec)
+    init_worker(
+        instance_from_arrays(_instance_arrays.arrays, vehicles), evaluator, repair
+    )
+
+
+def population_buffer(spec):
+    # The main process replaces the block when it outgrows it
+    global _population
+    if _population is None or _population.spec[0] != spec[0]:
+        if _population is not None:
+            _population.close()
+        _population = SharedArrays.attach(spec)
+    return _population
+
+
+def evaluate_rows(spec, start, stop):
+    population = population_buffer(spec)
+    genomes = population["genomes"][start:stop].tolist()
+    fitnesses = [fit[0] for fit in evaluate_chunk(genomes)]
+    population["fitnesses"][start:stop] = fitnesses
+
+
+def correct_rows(spec, start, stop):
+    population = population_buffer(spec)
+    genomes = population["genomes"][start:stop]
+    genomes[:] = correct_chunk(genomes.tolist())
+
+
+# The batch operators of the `matrix` engine, rows are handled as arrays
+
+
+def evaluate_genome_rows(spec, start, stop):
+    population = population_buffer(spec)
+    genomes = population["genomes"][start:stop]
+    population["fitnesses"][start:stop] = evaluate_genomes_chunk(genomes)
+
+
+def correct_genome_rows(spec, start, stop):
+    # Repaired in place, straight in the shared block
+    population = population_buffer(spec)
+    correct_genomes_chunk(population["genomes"][start:stop])
+
+
+#
+# Main process side
+#
+
+
+class SharedPool:
+    """
+    Process pool that evaluates and repairs individuals through shared memory.
+    Same operators as the `scripts.parallel` pool, for individuals or whole
+    genome matrices.
+    """
+
+    def __init__(
+        self, instance, evaluator, workers, start_method=None, repair=correct_route
+    ):
+        self.workers = workers
+        self.instance_arrays = SharedArrays.from_arrays(
+            {
+                key: instance[key]
+                for key in INSTANCE_ARRAYS
+                if isinstance(instance[key], np.ndarray)
+            }
+        )
+        self.population = None
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=init_shared_worker,
+            initargs=(
+                self.instance_arrays.spec,
+                instance["vehicles"],
+                evaluator,
+                repair,
+            ),
+        )
+
+    def load(self, genomes):
+        # Copies `genomes` to the population block, growing it if needed
+        genomes = np.asarray(genomes)
+        rows, genome_len = genomes.shape
+        capacity = 0
+        if self.population is not None:
+            capacity, current_len = self.population["genomes"].shape
+            if capacity < rows or current_len != genome_len:
+                self.population.unlink()
+                self.population = None
+        if self.population is None:
+            # Doubled so a growing population is not copied every generation
+            capacity = max(rows, 2 * capacity)
+            self.population = SharedArrays.create(
+                {
+                    "genomes": ((capacity, genome_len), np.int32),
+                    "fitnesses": ((capacity,), np.float64),
+                }
+            )
+        self.population["genomes"][:rows] = genomes
+        return rows
+
+    def map_rows(self, task, rows):
+        size = max(1, math.ceil(rows / self.workers))
+        starts = range(0, rows, size)
+        stops = [min(start + size, rows) for start in starts]
+        specs = [self.population.spec] * len(starts)
+        # Consumed so worker errors are raised here
+        list(self.executor.map(task, specs, starts, stops))
+
+    def evaluate_genomes(self, genomes):
+        rows = self.load(genomes)
+        self.map_rows(evaluate_genome_rows, rows)
+        return self.population["fitnesses"][:rows].copy()
+
+    def correct_genomes(self, genomes):
+        rows = self.load(genomes)
+        self.map_rows(correct_genome_rows, rows)
+        genomes[:] = self.population["genomes"][:rows]
+        return genomes
+
+    def evaluate_population(self, individuals):
+        if not individuals:
+            return []
+        rows = self.load(individuals)
+        self.map_rows(evaluate_rows, rows)
+        return [(cost,) for cost in self.population["fitnesses"][:rows].tolist()]
+
+    def correct_population(self, individuals):
+        if not individuals:
+            return individuals
+        rows = self.load(individuals)
+        self.map_rows(correct_rows, rows)
+        for ind, genome in zip(individuals, self.population["genomes"][:rows].tolist()):
+            ind[:] = genome
+        return individuals
+
+    def shutdown(self):
+        self.executor.shutdown()
+        if self.population is not None:
+            self.population.unlink()
+        self.instance_arrays.unlink()
@@ -0,0 +1,97 @@
+import numpy as np
+
+from scripts.utils import as_list, correct_route
+
+#
+# Split decoder (Prins, 2004). Part 1 is read as a giant tour and part 2 is
+# replaced by the cheapest way of cutting it into consecutive routes, one per
+# vehicle in the order of `instance["vehicles"]`.
+#
+
+
+def segment_costs(tour, instance, lookahead=None):
+    """
+    Costs of every route made of consecutive stores of `tour`. Row `l - 1`,
+    column `j` holds the route with the `l` stores that end right before
+    position `j`, as `(tardiness, travel time, demand)` arrays. Routes longer
+    than `lookahead` stores, or that do not fit in any vehicle, are left out.
+    """
+    store_count = len(tour)
+    depot = len(instance["distances"]) - 1
+    distances = instance["distances"]
+    ready_times = instance["ready_times"][tour]
+    due_dates = instance["due_dates"][tour]
+    service_times = instance["service_times"][tour]
+    demands = instance["demands"][tour]
+    max_capacity = instance["capacities"].max()
+    max_stores = min(lookahead or store_count, store_count)
+
+    shape = (max_stores, store_count + 1)
+    tardiness, travel = np.full(shape, np.inf), np.full(shape, np.inf)
+    load = np.full(shape, np.inf)
+
+    legs = distances[tour[:-1], tour[1:]]
+    returns = distances[tour, depot]
+    # Same arithmetic as `eval_route_matrix`, for all the start stores at once
+    t = np.maximum(distances[depot, tour], ready_times) + service_times
+    cost = np.maximum(0, t - due_dates)
+    demand = demands
+    for length in range(1, max_stores + 1):
+        if length > 1:
+            t = np.maximum(t[:-1] + legs[length - 2 :], ready_times[length - 1 :])
+            t += service_times[length - 1 :]
+            cost = cost[:-1] + np.maximum(0, t - due_dates[length - 1 :])
+            demand = demand[:-1] + demands[length - 1 :]
+        if demand.min() > max_capacity:
+            max_stores = length - 1
+            break
+        tardiness[length - 1, length:] = cost
+        travel[length - 1, length:] = t + returns[length - 1 :]
+        load[length - 1, length:] = demand
+
+    return tardiness[:max_stores], travel[:max_stores], load[:max_stores]
+
+
+def split_routes(store_count, instance, ind, lookahead=None):
+    """
+    Replaces part 2 of `ind` with the optimal split of its part 1, found as a
+    shortest path over the DAG of consecutive routes, one vehicle per layer.
+    Falls back to `correct_route` when no split satisfies the capacities.
+    """
+    ind = as_list(ind)
+    tour = np.array(ind[:store_count])
+    tardiness, travel, load = segment_costs(tour, instance, lookahead)
+
+    # Route costs for every distinct vehicle
+    route_costs = {}
+    for capacity, rate in zip(instance["capacities"], instance["rates"]):
+        if (capacity, rate) not in route_costs:
+            costs = tardiness + travel * rate
+            costs[load > capacity] = np.inf
+            route_costs[capacity, rate] = costs
+
+    # best[j] is the cheapest way of serving the first `j` stores so far
+    columns = np.arange(store_count + 1)
+    lengths = np.arange(1, len(tardiness) + 1)[:, np.newaxis]
+    route_starts = np.maximum(columns - lengths, 0)
+    best = np.full(store_count + 1, np.inf)
+    best[0] = 0
+    previous = np.empty((len(instance["vehicles"]), store_count + 1), dtype=int)
+    for v_idx, key in enumerate(zip(instance["capacities"], instance["rates"])):
+        candidates = best[route_starts] + route_costs[key]
+        shortest = candidates.argmin(axis=0)
+        candidate = candidates[shortest, columns]
+        # Otherwise the vehicle gets an empty route
+        improves = candidate < best
+        previous[v_idx] = np.where(improves, route_starts[shortest, columns], columns)
+        best = np.where(improves, candidate, best)
+
+    if not np.isfinite(best[-1]):
+        return correct_route(store_count, instance, ind)
+
+    route_finish_idx = store_count
+    route_idxs = []
+    for v_idx in range(len(previous) - 1, 0, -1):
+        route_finish_idx = int(previous[v_idx, route_finish_idx])
+        route_idxs.append(route_finish_idx)
+    return ind[:store_count] + route_idxs[::-1]
@@ -0,0 +1,73 @@
+from collections import deque
+
+import numpy as np
+
+
+class StoppingRule:
+    """
+    Decides when a run has converged. Every criterion is optional:
+    `stall` generations without a new best, a relative improvement under
+    `epsilon` over the last `window` generations, a `time_budget` in seconds and
+    a `target` cost.
+    """
+
+    def __init__(
+        self, stall=None, epsilon=None, window=100, time_budget=None, target=None
+    ):
+        self.stall = stall
+        self.epsilon = epsilon
+        self.time_budget = time_budget
+        self.target = target
+        self.bests = deque(maxlen=window + 1)
+        self.best = float("inf")
+        self.stalled = 0
+
+    def update(self, best, elapsed):
+        # Called once per generation, returns the reason to stop, if any
+        if best < self.best:
+            self.best, self.stalled = best, 0
+        else:
+            self.stalled += 1
+        self.bests.append(best)
+
+        if self.target is not None and best <= self.target:
+            return "target"
+        if self.stall is not None and self.stalled >= self.stall:
+            return "stall"
+        if (
+            self.epsilon is not None
+            and len(self.bests) == self.bests.maxlen
+            and self.bests[0] - best < self.epsilon * self.bests[0]
+        ):
+            return "epsilon"
+        if self.time_budget is not None and elapsed >= self.time_budget:
+            return "time_budget"
+        return None
+
+    def state(self):
+        # What `update` has seen so far, for the checkpoints
+        return {
+            "best": self.best,
+            "stalled": self.stalled,
+            "bests": np.array(self.bests, dtype=float),
+        }
+
+    def restore(self, state):
+        self.best = float(state["best"])
+        self.stalled = int(state["stalled"])
+        self.bests.clear()
+        self.bests.extend(state["bests"].tolist())
+
+
+def adaptive_rates(mutpb1, mutpb2, mean, std, threshold=0.01, max_rate=0.8):
+    """
+    Mutation probabilities for the next generation. They stay at `mutpb1` and
+    `mutpb2` while the coefficient of variation of the fitnesses is over
+    `threshold`, and grow linearly up to `max_rate` as it collapses to 0.
+    """
+    diversity = std / mean if mean else 0
+    collapse = max(0.0, 1 - diversity / threshold)
+    return (
+        mutpb1 + (max(max_rate, mutpb1) - mutpb1) * collapse,
+        mutpb2 + (max(max_rate, mutpb2) - mutpb2) * collapse,
+    )
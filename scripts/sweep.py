@@ -0,0 +1,291 @@
+import hashlib
+import itertools
+import json
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import Manager, get_context
+from pathlib import Path
+
+import click
+import numpy as np
+
+from instances.parser import get_instancer
+from scripts.fitness_log import FitnessLog
+from scripts.main import (
+    create_instrumentation,
+    create_output_folder,
+    create_stopping_rule,
+    create_toolbox,
+    evaluate_invalid,
+    evolve,
+    main,
+    write_result,
+)
+
+#
+# Parameter sweeps: every configuration of a grid or random search spec runs
+# with several seeds on a pool of long lived worker processes, so imports and
+# parsed instances are loaded once per worker.
+#
+# The spec is a JSON file with the `mtsp` options shared by every run under
+# "fixed" and either a "grid" of values to combine or a "random" search:
+#
+#   {"fixed": {"ins": "c101", "rounds": 1000},
+#    "grid": {"cxpb1": [0.6, 0.8], "part2_type": ["choice", "greedy"]}}
+#
+#   {"fixed": {"ins": "rc201", "h": true},
+#    "random": {"samples": 20, "seed": 0,
+#               "space": {"cxpb1": {"uniform": [0.4, 0.9]},
+#                         "pop_size": {"randint": [50, 300]},
+#                         "part2_type": ["choice", "greedy"]}}}
+#
+
+# Options of `mtsp` a sweep cannot change
+FORCED = {"workers": 1, "islands": 1, "save_fig": False, "resume": False}
+
+
+def expand_spec(spec):
+    """
+    Every configuration of `spec` as a dict with all the `mtsp` options, and
+    the names of the options that vary. The random samples only depend on the
+    spec, so a sweep can be run again.
+    """
+    # The values `mtsp` would get with no arguments
+    defaults = main.make_context("mtsp", []).params
+    fixed = spec.get("fixed", {})
+    if "grid" in spec:
+        keys = list(spec["grid"])
+        variations = [
+            dict(zip(keys, values))
+            for values in itertools.product(*(spec["grid"][key] for key in keys))
+        ]
+    elif "random" in spec:
+        rng = random.Random(spec["random"].get("seed", 0))
+        variations = []
+        for _ in range(spec["random"]["samples"]):
+            variation = {}
+            for key, space in spec["random"]["space"].items():
+                if isinstance(space, list):
+                    variation[key] = rng.choice(space)
+                elif "uniform" in space:
+                    variation[key] = rng.uniform(*space["uniform"])
+                elif "randint" in space:
+                    variation[key] = rng.randint(*space["randint"])
+                else:
+                    raise ValueError(f"Unknown search space for `{key}`.")
+            variations.append(variation)
+    else:
+        raise ValueError("The spec needs a `grid` or a `random` search.")
+
+    configs = []
+    for variation in variations:
+        config = dict(defaults, **fixed, **variation, **FORCED)
+        unknown = config.keys() - defaults.keys()
+        if unknown:
+            raise ValueError(f"Unknown `mtsp` options: `{', '.join(sorted(unknown))}`.")
+        configs.append(config)
+    return configs, list(variations[0]) if variations else []
+
+
+def config_name(config):
+    # Same options, same name, so finished runs are found again
+    options = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(options.encode()).hexdigest()[:10]
+
+
+@lru_cache(maxsize=None)
+def load_instancer(ins, h):
+    # Building an instancer uses no RNG, so runs of a worker can share it
+    return get_instancer(ins, heterogeneous_vehicles=h)
+
+
+def run_config(
+    run_name, options, seed, best_by_generation, prune_margin, prune_interval
+):
+    """
+    Runs one configuration with `seed`. Every `prune_interval` generations its
+    best cost is compared with the best any run reached at that point, and it
+    is stopped once it is `prune_margin` (a fraction) worse.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    instance = load_instancer(options["ins"], options["h"])
+    instance_dict = instance.get_instance_dict()
+    toolbox, _ = create_toolbox(
+        options["ins"],
+        heterogeneous_vehicles=options["h"],
+        part2_type=options["part2_type"],
+        evaluator=options["evaluator"],
+        instance_dict=instance_dict,
+        genome=options["genome"],
+        decoder=options["decoder"],
+        split_lookahead=options["split_lookahead"],
+        fitness_cache=options["fitness_cache"],
+        route_cache=options["route_cache"],
+        selection=options["selection"],
+        local_search=options["local_search"],
+        local_search_rate=options["local_search_rate"],
+        neighbours=options["neighbours"],
+        backend=options["backend"],
+        engine=options["engine"],
+        screen_margin=options["screen_margin"],
+        instancer=instance,
+    )
+    output_folder = create_output_folder(run_name, instance, dict(options, seed=seed))
+    fitness_log = FitnessLog(
+        output_folder / "analysis",
+        flush_interval=options["flush_interval"],
+        columnar=options["columnar"],
+    )
+    phase_log, generation_profiler = create_instrumentation(
+        toolbox, options, output_folder / "analysis"
+    )
+
+    start = time.time()
+    pop = toolbox.population(n=options["pop_size"])
+    evaluate_invalid(toolbox, pop)
+    all_time_fittest = min(pop, key=lambda ind: ind.fitness.values[0])
+
+    def prune(g, pop, all_time_fittest, stop_reason):
+        if prune_margin is None or (g + 1) % prune_interval:
+            return None
+        best = all_time_fittest.fitness.values[0]
+        key = (options["ins"], options["h"], g)
+        best_known = best_by_generation.get(key, best)
+        if best <= best_known:
+            best_by_generation[key] = best
+        elif best > best_known * (1 + prune_margin):
+            return f"pruned_at={g}"
+        return None
+
+    _, all_time_fittest, _, stop_reason = evolve(
+        toolbox,
+        pop,
+        all_time_fittest,
+        options,
+        fitness_log,
+        create_stopping_rule(options),
+        start,
+        after_generation=prune,
+        generation_profiler=generation_profiler,
+        phase_log=phase_log,
+    )
+    fitness_log.close()
+    if phase_log:
+        phase_log.close()
+    if generation_profiler:
+        generation_profiler.stop()
+    toolbox.shutdown()
+
+    elapsed = time.time() - start
+    with open(output_folder / "analysis" / "config.txt", "a") as f_config:
+        f_config.write(f"elapsed={elapsed:.2f}s\n")
+        f_config.write(f"status={stop_reason or 'finished'}\n")
+    write_result(
+        output_folder / "result.txt",
+        all_time_fittest,
+        len(instance.stores) - 1,
+        instance_dict["vehicles"] if options["h"] else None,
+    )
+
+
+def read_run(run_folder):
+    # Best cost, generations, elapsed seconds and status of a finished run
+    with open(run_folder / "result.txt") as f_result:
+        best = float(f_result.read().split()[-1])
+    with open(run_folder / "analysis" / "config.txt") as f_config:
+        config = dict(line.rstrip("\n").split("=", 1) for line in f_config)
+    with open(run_folder / "analysis" / "fitness.csv") as f_fitnesses:
+        generations = sum(1 for _ in f_fitnesses) - 1
+    return {
+        "best": best,
+        "generations": generations,
+        "elapsed": float(config["elapsed"].rstrip("s")),
+        "status": config.get("status", "finished"),
+    }
+
+
+@click.command()
+@click.argument("spec", type=click.Path(exists=True))
+@click.option("--name", default=None, type=str)
+@click.option("--seeds", default=3, type=int)
+@click.option("--concurrency", default=2, type=int)
+@click.option("--prune-margin", default=None, type=float)
+@click.option("--prune-interval", default=100, type=int)
+@click.option(
+    "--start-method",
+    default=None,
+    type=click.Choice(["fork", "spawn", "forkserver"]),
+)
+def sweep(spec, name, seeds, concurrency, prune_margin, prune_interval, start_method):
+    """
+    Runs every configuration of SPEC with `--seeds` seeds, at most
+    `--concurrency` at a time, and writes `summary.csv` next to the runs.
+    Runs that already finished are not run again.
+    """
+    with open(spec) as f_spec:
+        configs, varied = expand_spec(json.load(f_spec))
+    sweep_folder = Path("results") / (name or Path(spec).stem)
+    sweep_folder.mkdir(parents=True, exist_ok=True)
+
+    runs = []
+    for config in configs:
+        for seed in range(seeds):
+            run_name = f"{sweep_folder.name}/{config_name(config)}_s{seed}"
+            runs.append((run_name, config, seed))
+
+    pending = []
+    for run_name, config, seed in runs:
+        run_folder = Path("results") / run_name
+        if (run_folder / "result.txt").exists():
+            continue
+        # Left behind by an interrupted sweep
+        if run_folder.exists():
+            shutil.rmtree(run_folder)
+        pending.append((run_name, config, seed))
+    click.echo(f"{len(runs)} runs, {len(runs) - len(pending)} already finished")
+
+    with Manager() as manager:
+        best_by_generation = manager.dict()
+        with ProcessPoolExecutor(
+            concurrency, mp_context=get_context(start_method)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    run_config,
+                    run_name,
+                    config,
+                    seed,
+                    best_by_generation,
+                    prune_margin,
+                    prune_interval,
+                )
+                for run_name, config, seed in pending
+            ]
+            with click.progressbar(futures, label="Sweeping") as bar:
+                for future in bar:
+                    future.result()
+
+    columns = list(dict.fromkeys(["ins", "h", *varied]))
+    rows = []
+    for run_name, config, seed in runs:
+        row = {"run": Path(run_name).name, "seed": seed}
+        row.update({key: config[key] for key in columns})
+        row.update(read_run(Path("results") / run_name))
+        rows.append(row)
+    # Only needed for the summary, workers never import it
+    import pandas as pd
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(sweep_folder / "summary.csv", index=False)
+
+    grouped = summary.groupby(columns)["best"]
+    table = grouped.agg(["mean", "std", "min", "count"]).sort_values("mean")
+    click.echo(table.to_string())
+
+
+if __name__ == "__main__":
+    sweep()
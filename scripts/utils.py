@@ -1,15 +1,29 @@
 import logging
 import math
 import random
-from operator import attrgetter
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from pathlib import Path
 
-import matplotlib.pyplot as plt
-import matplotlib.rcsetup as rcsetup
 import numpy as np
+from deap import base, creator
 
 logger = logging.getLogger("Toolbox")
 
+
+def create_types():
+    # Guarded so every process, including spawned pool workers, can call it.
+    if not hasattr(creator, "FitnessMin"):
+        creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
+    if not hasattr(creator, "Individual"):
+        creator.create("Individual", list, fitness=creator.FitnessMin)
+
+
+def as_list(ind):
+    # Array genomes are turned into plain lists before the per-store loops
+    return ind.tolist() if isinstance(ind, np.ndarray) else ind
+
+
 #
 # mTSP specific initializer
 #
@@ -35,7 +49,9 @@ def find_min_index(route, vehicle_idx, instance):
     return len(route)
 
 
-def correct_route(store_count, instance, ind):
+def correct_route_two_pass(store_count, instance, ind):
+    # Original repair, kept as the reference for `correct_route`
+    ind = as_list(ind)
     routes, route_idxs = ind[:store_count], ind[store_count:]
 
     valid_route_idxs = []
@@ -66,6 +82,79 @@ def correct_route(store_count, instance, ind):
     return routes + reversed_valid_route_idxs[::-1]
 
 
+def correct_route(store_count, instance, ind):
+    """
+    Same repair as `correct_route_two_pass`, with the route limits found by
+    binary search over the demand prefix sums of part 1 instead of walking
+    and slicing every route.
+    """
+    ind = as_list(ind)
+    routes, route_idxs = ind[:store_count], ind[store_count:]
+    demands = instance["lookup"]["demands"]
+    capacities = instance["lookup"]["capacities"]
+    # prefix[idx] is the demand of the first `idx` stores
+    prefix = [0, *accumulate(map(demands.__getitem__, routes))]
+
+    # Forward pass: every vehicle keeps at most the stores that fit in it
+    valid_route_idxs = []
+    route_start_idx = 0
+    for vehicle_idx, route_finish_idx in enumerate(route_idxs):
+        max_demand = prefix[route_start_idx] + capacities[vehicle_idx]
+        fit_idx = bisect_right(prefix, max_demand, route_start_idx) - 1
+        route_start_idx = max(route_start_idx, min(route_finish_idx, fit_idx))
+        valid_route_idxs.append(route_start_idx)
+
+    # Backward pass: every vehicle takes the stores left over by the next ones
+    route_finish_idx = store_count
+    for vehicle_idx in range(len(valid_route_idxs), 0, -1):
+        min_demand = prefix[route_finish_idx] - capacities[vehicle_idx]
+        fit_idx = bisect_left(prefix, min_demand, 0, route_finish_idx)
+        route_finish_idx = max(valid_route_idxs[vehicle_idx - 1], fit_idx)
+        valid_route_idxs[vehicle_idx - 1] = route_finish_idx
+
+    return routes + valid_route_idxs
+
+
+def correct_genomes(store_count, instance, genomes):
+    """
+    `correct_route` of every row of a 2-D integer array, in place. Each pass
+    walks the vehicles once for all the rows, the binary searches become
+    counts over the demand prefix sums, which never decrease.
+    """
+    demands = instance["demands"]
+    capacities = instance["capacities"]
+    routes, route_idxs = genomes[:, :store_count], genomes[:, store_count:]
+    prefix = np.zeros((len(genomes), store_count + 1))
+    np.cumsum(demands[routes], axis=1, out=prefix[:, 1:])
+    rows = np.arange(len(genomes))
+
+    route_start_idx = np.zeros(len(genomes), dtype=np.int64)
+    for vehicle_idx in range(route_idxs.shape[1]):
+        max_demand = prefix[rows, route_start_idx] + capacities[vehicle_idx]
+        fits = (prefix <= max_demand[:, np.newaxis]).sum(axis=1)
+        fit_idx = np.maximum(route_start_idx, fits) - 1
+        route_start_idx = np.maximum(
+            route_start_idx, np.minimum(route_idxs[:, vehicle_idx], fit_idx)
+        )
+        route_idxs[:, vehicle_idx] = route_start_idx
+
+    route_finish_idx = np.full(len(genomes), store_count)
+    for vehicle_idx in range(route_idxs.shape[1], 0, -1):
+        min_demand = prefix[rows, route_finish_idx] - capacities[vehicle_idx]
+        fits = (prefix < min_demand[:, np.newaxis]).sum(axis=1)
+        fit_idx = np.minimum(route_finish_idx, fits)
+        route_finish_idx = np.maximum(route_idxs[:, vehicle_idx - 1], fit_idx)
+        route_idxs[:, vehicle_idx - 1] = route_finish_idx
+    return genomes
+
+
+def correct_population(store_count, instance, individuals, repair=correct_route):
+    # `repair` returns a new genome, write it back into each individual.
+    for ind in individuals:
+        ind[:] = repair(store_count, instance, ind)
+    return individuals
+
+
 def valid_route_capacity(route, vehicle_idx, instance):
     """
     Given a route and a vehicle we check that the vehicle can fulfill the route's demand.
@@ -85,6 +174,7 @@ def validate_capacities(individual, store_count, instance):
     # Si vemos que alcanza, está todo bien y seguimos, sino, cortamos ahí y le pasamos las tiendas restantes al siguiente camión.
     # Si el último camión tiene tiendas sobrantes, entonces movemos la parte 1 para darle esas al primer camión y volvermos a arrancar.
 
+    individual = as_list(individual)
     routes, route_idxs = individual[:store_count], individual[store_count:]
     route_start_idx = 0
     for vehicle_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
@@ -139,7 +229,11 @@ def part2_initializer(ind, instance, type="greedy"):
 
 
 def init_iterate_and_distribute(
-    container, instance=None, part2_type="choice", assert_validation=False
+    container,
+    instance=None,
+    part2_type="choice",
+    assert_validation=False,
+    repair=correct_route,
 ):
     if not instance:
         raise ValueError("`instance` cannot be None.")
@@ -152,7 +246,7 @@ def init_iterate_and_distribute(
     route_idx = part2_initializer(individual, instance, type=part2_type)
     individual.extend(route_idx)
 
-    individual = correct_route(store_count, instance, individual)
+    individual = repair(store_count, instance, individual)
     if assert_validation:
         valid, vehicle_idx, route, s_idx, f_idx = validate_capacities(
             individual, store_count, instance
@@ -185,8 +279,10 @@ def part_one_edit(func, part_one_len):
     def apply_part_one(*args):
         part1 = slice(part_one_len)
         parts = [ind[part1] for ind in args]
-        for updated, original in zip(func(*parts), args):
-            original[part1] = updated
+        for updated, part, original in zip(func(*parts), parts, args):
+            # Array genomes hand out views, already edited in place
+            if updated is not part or not isinstance(original, np.ndarray):
+                original[part1] = updated
         return args
 
     return apply_part_one
@@ -196,8 +292,9 @@ def part_two_edit(func, part_one_len):
     def apply_part_two(*args):
         part2 = slice(part_one_len, None)
         parts = [ind[part2] for ind in args]
-        for updated, original in zip(func(*parts), args):
-            original[part2] = updated
+        for updated, part, original in zip(func(*parts), parts, args):
+            if updated is not part or not isinstance(original, np.ndarray):
+                original[part2] = updated
         return args
 
     return apply_part_two
@@ -245,7 +342,7 @@ def regenerate_op(ind, max_value):
 def reverse_op(ind):
     idx1 = random.randint(0, len(ind) - 3)
     idx2 = random.randint(idx1 + 2, len(ind) - 1)
-    ind[idx1:idx2] = reversed(ind[idx1:idx2])
+    ind[idx1:idx2] = ind[idx1:idx2][::-1]
     return (ind,)
 
 
@@ -281,22 +378,216 @@ def eval_route(route, v_idx, instance):
     return cost + t * instance["vehicles"][v_idx]["rate"]
 
 
-def eval_routes(individual, instance=None):
+def eval_route_matrix(route, v_idx, instance):
+    # Same as `eval_route` but using the precomputed distance matrix.
+    # The warehouse is the last store, so its index is the store count.
+    lookup = instance["lookup"]
+    distances = lookup["distances"]
+    ready_times = lookup["ready_times"]
+    due_dates = lookup["due_dates"]
+    service_times = lookup["service_times"]
+    t = cost = 0
+
+    prev_store = depot = len(distances) - 1
+    for store in route:
+        t += distances[prev_store][store]
+
+        if t < ready_times[store]:
+            t = ready_times[store]
+        t += service_times[store]
+        cost += max(0, t - due_dates[store])
+
+        prev_store = store
+
+    # Add return to deposit time
+    t += distances[prev_store][depot]
+    return cost + t * lookup["rates"][v_idx]
+
+
+def eval_routes(individual, instance=None, scalar=False):
+    """
+    Total cost of an individual. `scalar=True` uses the original per-pair
+    distance calculation, which is kept to check the matrix lookups against.
+    """
     if not instance:
         raise ValueError("`instance` cannot be None.")
 
     store_count = len(instance["stores"]) - 1
+    individual = as_list(individual)
     routes, route_idxs = individual[:store_count], individual[store_count:]
+    route_cost = eval_route if scalar else eval_route_matrix
 
     cost = 0
     route_start_idx = 0
     for v_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
-        cost += eval_route(routes[route_start_idx:route_finish_idx], v_idx, instance)
+        cost += route_cost(routes[route_start_idx:route_finish_idx], v_idx, instance)
         route_start_idx = route_finish_idx
 
     return (cost,)
 
 
+class RouteCache:
+    """
+    Per-route costs of the last evaluated genome of an individual, with the
+    departure time and accumulated tardiness after every store of each route.
+    """
+
+    __slots__ = ("routes", "costs", "times", "tardiness")
+
+    def __init__(self, routes, costs, times, tardiness):
+        self.routes = routes
+        self.costs = costs
+        self.times = times
+        self.tardiness = tardiness
+
+    def __deepcopy__(self, memo):
+        # Never edited in place, clones can share it
+        return self
+
+
+def eval_route_cached(route, v_idx, instance, cached=None):
+    """
+    `eval_route_matrix` that also returns the departure time and tardiness
+    after each store. Given the `(route, times, tardiness)` of a previous
+    evaluation, the common prefix of both routes is not recomputed.
+    """
+    lookup = instance["lookup"]
+    distances = lookup["distances"]
+    ready_times = lookup["ready_times"]
+    due_dates = lookup["due_dates"]
+    service_times = lookup["service_times"]
+    t = cost = 0
+    times, tardiness = [], []
+
+    prev_store = depot = len(distances) - 1
+    start = 0
+    if cached:
+        old_route, old_times, old_tardiness = cached
+        limit = min(len(route), len(old_route))
+        while start < limit and route[start] == old_route[start]:
+            start += 1
+        if start:
+            times, tardiness = old_times[:start], old_tardiness[:start]
+            t, cost = times[-1], tardiness[-1]
+            prev_store = route[start - 1]
+
+    for store in route[start:]:
+        t += distances[prev_store][store]
+
+        if t < ready_times[store]:
+            t = ready_times[store]
+        t += service_times[store]
+        cost += max(0, t - due_dates[store])
+
+        times.append(t)
+        tardiness.append(cost)
+        prev_store = store
+
+    # Add return to deposit time
+    t += distances[prev_store][depot]
+    return cost + t * lookup["rates"][v_idx], times, tardiness
+
+
+def eval_routes_delta(individual, instance=None):
+    """
+    Same cost as `eval_routes`, but only the routes that changed since the
+    individual was last evaluated are recomputed. Clones share the cache of
+    their parent, so mutants only pay for the routes their mutation touched.
+    """
+    if not instance:
+        raise ValueError("`instance` cannot be None.")
+
+    store_count = len(instance["stores"]) - 1
+    genome = as_list(individual)
+    routes, route_idxs = genome[:store_count], genome[store_count:]
+    cache = getattr(individual, "route_cache", None)
+
+    new_routes, costs, times, tardiness = [], [], [], []
+    route_start_idx = 0
+    for v_idx, route_finish_idx in enumerate(route_idxs + [store_count]):
+        route = routes[route_start_idx:route_finish_idx]
+        if cache is not None and cache.routes[v_idx] == route:
+            route_cost = cache.costs[v_idx]
+            route_times = cache.times[v_idx]
+            route_tardiness = cache.tardiness[v_idx]
+        else:
+            cached = None
+            if cache is not None:
+                cached = cache.routes[v_idx], cache.times[v_idx], cache.tardiness[v_idx]
+            route_cost, route_times, route_tardiness = eval_route_cached(
+                route, v_idx, instance, cached
+            )
+        new_routes.append(route)
+        costs.append(route_cost)
+        times.append(route_times)
+        tardiness.append(route_tardiness)
+        route_start_idx = route_finish_idx
+
+    individual.route_cache = RouteCache(new_routes, costs, times, tardiness)
+    return (sum(costs),)
+
+
+def route_vehicles(route_idxs, store_count):
+    # Vehicle serving each position: how many route limits are at or before it.
+    rows = np.arange(len(route_idxs))[:, np.newaxis]
+    limits = np.bincount(
+        (rows * (store_count + 1) + route_idxs).ravel(),
+        minlength=len(route_idxs) * (store_count + 1),
+    ).reshape(len(route_idxs), store_count + 1)
+    return limits.cumsum(axis=1)[:, :store_count]
+
+
+def eval_genomes(genomes, instance):
+    """
+    Vectorized `eval_routes` for a 2-D integer array with one individual per row.
+    Walks the route positions once, updating every individual at the same time.
+    Returns a 1-D array with the cost of each row.
+    """
+    genomes = np.asarray(genomes, dtype=np.int64)
+    store_count = len(instance["stores"]) - 1
+    depot = store_count
+    routes, route_idxs = genomes[:, :store_count], genomes[:, store_count:]
+
+    positions = np.arange(store_count)
+    vehicle = route_vehicles(route_idxs, store_count)
+    starts = np.ones_like(routes, dtype=bool)
+    starts[:, 1:] = vehicle[:, 1:] != vehicle[:, :-1]
+    ends = np.ones_like(routes, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+
+    prev_stores = np.empty_like(routes)
+    prev_stores[:, 0] = depot
+    prev_stores[:, 1:] = routes[:, :-1]
+    prev_stores[starts] = depot
+    legs = instance["distances"][prev_stores, routes]
+    ready_times = instance["ready_times"][routes]
+    due_dates = instance["due_dates"][routes]
+    service_times = instance["service_times"][routes]
+    rates = instance["rates"][vehicle]
+    returns = instance["distances"][routes, depot]
+
+    cost = np.zeros(len(genomes))
+    t = np.zeros(len(genomes))
+    for pos in positions:
+        t[starts[:, pos]] = 0
+        t += legs[:, pos]
+        np.maximum(t, ready_times[:, pos], out=t)
+        t += service_times[:, pos]
+        cost += np.maximum(0, t - due_dates[:, pos])
+        # Close the route with the return to the deposit
+        cost += np.where(ends[:, pos], (t + returns[:, pos]) * rates[:, pos], 0)
+
+    return cost
+
+
+def eval_population(individuals, instance=None):
+    if not instance:
+        raise ValueError("`instance` cannot be None.")
+    if not individuals:
+        return []
+    return [(cost,) for cost in eval_genomes(individuals, instance).tolist()]
+
+
 #
 # Drawing tools
 #
@@ -307,6 +598,10 @@ def draw_individual(ind, stores, gen, run_name, save_fig=False):
     ind: Chromosome
     stores: np.array shape: (#stores,2) with the x and y coordinates of each store.
     """
+    # Imported here, matplotlib takes longer to import than the rest of the GA
+    import matplotlib.pyplot as plt
+    import matplotlib.rcsetup as rcsetup
+
     num_stores = len(stores) - 1
     fig, ax = plt.subplots(
         1, 2, sharex=True, sharey=True, figsize=(15, 7.5)
@@ -320,32 +615,35 @@ def draw_individual(ind, stores, gen, run_name, save_fig=False):
     ax[0].set_box_aspect(1)
     ax[1].set_box_aspect(1)
 
+    colors = gist_rainbow(idx)
+    arrow_starts, arrow_ends, arrow_colors = [], [], []
     start = 0
     for i, finish in enumerate(np.append(ind[num_stores:], num_stores)):
         ind_slice = ind[start:finish]
         store_slice = stores[ind_slice]
-        res = ax[0].scatter(
-            store_slice[:, 0], store_slice[:, 1], marker=f"${i}$"
-        )  # plot A
+        ax[0].scatter(store_slice[:, 0], store_slice[:, 1], marker=f"${i}$")  # plot A
         ax[1].scatter(store_slice[:, 0], store_slice[:, 1])  # plot B
-        for j in range(len(ind_slice) - 1):
-            start_node = ind_slice[j]
-            start_pos = stores[start_node]
-            next_node = ind_slice[j + 1]
-            end_pos = stores[next_node]
-            ax[1].annotate(
-                "",
-                xy=start_pos,
-                xycoords="data",
-                xytext=end_pos,
-                textcoords="data",
-                arrowprops=dict(
-                    arrowstyle="->",
-                    connectionstyle="arc3",
-                    color=res.get_facecolors()[0],
-                ),
-            )
+        # Arrows point from each store to the previous one in the route
+        arrow_starts.extend(store_slice[1:])
+        arrow_ends.extend(store_slice[:-1])
+        arrow_colors.extend([colors[i % len(colors)]] * (len(store_slice) - 1))
         start = finish
+    # All the arrows in a single artist instead of one annotation per edge
+    if arrow_starts:
+        arrow_starts, arrow_ends = np.array(arrow_starts), np.array(arrow_ends)
+        ax[1].quiver(
+            arrow_starts[:, 0],
+            arrow_starts[:, 1],
+            arrow_ends[:, 0] - arrow_starts[:, 0],
+            arrow_ends[:, 1] - arrow_starts[:, 1],
+            color=arrow_colors,
+            angles="xy",
+            scale_units="xy",
+            scale=1,
+            width=0.0025,
+            headwidth=5,
+            headlength=7,
+        )
     plt.title(f"Job: {run_name} - Gen: {gen} - Fitness: {ind.fitness.values[0]:.2f}")
     if run_name is not None and save_fig:
         output_path = Path("results") / run_name / "analysis" / f"gen{gen}.jpg"
@@ -355,35 +653,61 @@ def draw_individual(ind, stores, gen, run_name, save_fig=False):
     plt.close()
 
 
+def fitness_array(individuals, fit_attr="fitness"):
+    # First objective of every individual, as one contiguous array
+    return np.fromiter(
+        (getattr(ind, fit_attr).values[0] for ind in individuals),
+        dtype=float,
+        count=len(individuals),
+    )
+
+
+def selTournamentArray(individuals, k, tournsize, fit_attr="fitness"):
+    """Same as :func:`deap.tools.selTournament` for a minimization fitness, but
+    the *k* tournaments are drawn at once as a *k* x *tournsize* matrix of
+    indices over the fitness array. The list returned contains references to
+    the input *individuals*.
+
+    This function uses the :mod:`numpy.random` module instead of :mod:`random`.
+    """
+    fits = fitness_array(individuals, fit_attr)
+    aspirants = np.random.randint(len(individuals), size=(k, tournsize))
+    winners = aspirants[np.arange(k), fits[aspirants].argmin(axis=1)]
+    return [individuals[idx] for idx in winners]
+
+
 def selInverseRoulette(individuals, k, fit_attr="fitness"):
     """Select *k* individuals from the input *individuals* using *k*
     spins of a roulette. The selection is made by looking only at the first
-    objective of each individual. The list returned contains references to
-    the input *individuals*.
+    objective of each individual, with a slot proportional to its inverse.
+    The list returned contains references to the input *individuals*.
 
     :param individuals: A list of individuals to select from.
     :param k: The number of individuals to select.
     :param fit_attr: The attribute of individuals to use as selection criterion
     :returns: A list of selected individuals.
 
-    This function uses the :func:`~random.random` function from the python base
-    :mod:`random` module.
+    This function uses the :mod:`numpy.random` module, the spins are found
+    with a binary search over the cumulative sum of the slots.
 
     .. warning::
-       The roulette selection by definition cannot be used for minimization
-       or when the fitness can be smaller or equal to 0.
+       The roulette selection by definition cannot be used when the fitness
+       can be smaller or equal to 0.
     """
+    wheel = np.cumsum(1 / fitness_array(individuals, fit_attr))
+    spins = np.random.random(k) * wheel[-1]
+    # Rounding can put a spin right at the end of the wheel
+    chosen = np.searchsorted(wheel, spins, side="right").clip(max=len(wheel) - 1)
+    return [individuals[idx] for idx in chosen]
 
-    s_inds = sorted(individuals, key=attrgetter(fit_attr), reverse=True)
-    sum_fits = sum(10000 / getattr(ind, fit_attr).values[0] for ind in individuals)
-    chosen = []
-    for i in range(k):
-        u = random.random() * sum_fits
-        sum_ = 0
-        for ind in s_inds:
-            sum_ += 10000 / getattr(ind, fit_attr).values[0]
-            if sum_ > u:
-                chosen.append(ind)
-                break
-
-    return chosen
+
+def selInverseSUS(individuals, k, fit_attr="fitness"):
+    """Stochastic universal sampling over the same inverse fitness wheel as
+    :func:`selInverseRoulette`: a single spin places *k* evenly spaced
+    pointers, so the individuals are picked close to their expected count.
+    """
+    wheel = np.cumsum(1 / fitness_array(individuals, fit_attr))
+    distance = wheel[-1] / k
+    pointers = (np.random.random() + np.arange(k)) * distance
+    chosen = np.searchsorted(wheel, pointers, side="right").clip(max=len(wheel) - 1)
+    return [individuals[idx] for idx in chosen]
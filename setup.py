@@ -20,5 +20,7 @@ setup(
     entry_points="""
         [console_scripts]
         mtsp=scripts.main:main
+        mtsp-bench=scripts.bench:cli
+        mtsp-sweep=scripts.sweep:sweep
     """,
 )